@@ -11,27 +11,227 @@ section below.
 
 from random import choice
 from random import randint as random_int
+from random import seed as random_seed
+from random import getstate as random_getstate
+from random import setstate as random_setstate
+from random import Random
 from time import sleep, time
+try:
+    from time import monotonic
+except ImportError:
+    monotonic = time
 from datetime import datetime
-from copy import deepcopy
+from copy import copy
+from collections import OrderedDict
 from termcolor import colored
 import os
 import sys
 import signal
 import subprocess
+import argparse
+import base64
+import json
+import hashlib
+import atexit
+import re
+import multiprocessing
+import struct
+import zlib
+import pickle
+from array import array
+
+# numpy is optional (only needed for the swarm engine)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# tracemalloc is optional (only needed for the memory benchmark)
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# asyncio and termios are optional (only needed for keyboard controls)
+try:
+    import asyncio
+    import termios
+    import tty
+except ImportError:
+    asyncio = None
+
+
+# Random numbers drawn a block at a time (for randint, thousands of times a loop)
+class RandomBlocks(object):
+    """Random integers, made a block at a time.
+
+    Each pair of bounds randint() is called with gets its own block of
+    integers, made all at once (by numpy if it's there, otherwise by its own
+    random.Random), and handed out with list.pop() -- so a call is a dict
+    lookup and a pop.  Blocks are made in the order they run out, so the
+    same seed gives the same numbers every time.
+    """
+    block = 256
 
+    def __init__(self, seed=None):
+        self.seed(seed)
 
-# wrapper for random.randint() --> avoids errors with float args
-def randint(a,b):
-    X = int(min(a,b))
-    Y = int(max(a,b))
-    return random_int(X,Y)
+    def seed(self, seed):
+        if np is not None:
+            self.source = np.random.RandomState(None if seed is None else seed % 2**32)
+        else:
+            self.source = Random(seed)
+        self.bounded  = {}      # (a, b) -> integers left
+
+    # (either way around, and floats are cut down to ints, like the old wrapper)
+    def randint(self, a, b):
+        try:
+            return self.bounded[a, b].pop()
+        except (KeyError, IndexError):
+            return self.refill(a, b)
+
+    def refill(self, a, b):
+        low  = int(min(a,b))
+        high = int(max(a,b))
+        if np is not None:
+            draws = self.source.randint(low, high + 1, self.block).tolist()
+        else:
+            random = self.source.random
+            span = high - low + 1
+            draws = [ low + int(random() * span) for _ in range(self.block) ]
+        self.bounded[a, b] = draws
+        return draws.pop()
 
+    # (to draw some numbers from a seed of their own, then carry on as before)
+    def getstate(self):
+        return (self.source, self.bounded)
+
+    def setstate(self, state):
+        self.source, self.bounded = state
+
+random_blocks = RandomBlocks()
+
+# numbers for the swarm engine's random moves (a numpy RandomState of its own,
+# so they don't use up anyone else's, see SwarmEngine)
+swarm_random = np.random.RandomState() if np is not None else None
+
+# wrapper for random.randint() --> avoids errors with float args
+# (seeded along with everything else, see SEED)
+randint = random_blocks.randint
+
+
+# a seed (it has to fit in a saved aquarium, see SNAPSHOT_HEADER)
+def seed_number(text):
+    seed = int(text)
+    if not -2**63 <= seed < 2**63:
+        raise argparse.ArgumentTypeError("seeds go from -2**63 to 2**63-1")
+    return seed
+
+# command-line options
+parser = argparse.ArgumentParser(description="A text-based aquarium for your terminal")
+parser.add_argument('-v', '--verbose', action='store_true',
+                    help="print info about the aquarium (toggle with ctrl-\\)")
+parser.add_argument('--swarm', action='store_true',
+                    help="move fish schools with the numpy swarm engine")
+parser.add_argument('--scroll', action='store_true',
+                    help="endless seabed, to scroll along with the left and right arrow keys")
+parser.add_argument('--world', metavar='COLUMNS', type=int,
+                    help="width of the world the creatures swim in, for the window to look into "
+                         "part of (moved with the left and right arrow keys)")
+parser.add_argument('--split', action='store_true',
+                    help="run the simulation in a second process, and only draw in this one")
+parser.add_argument('--benchmark', choices=['glyphs', 'blit', 'neighbors', 'swarm', 'snapshot',
+                                            'memory', 'store', 'random', 'seabed', 'world'],
+                    help="time part of the drawing code, then exit")
+parser.add_argument('--headless', action='store_true',
+                    help="run the simulation without any output, then print timings as JSON")
+parser.add_argument('--ticks', type=int, default=1000,
+                    help="number of loops to run with --headless (default: 1000)")
+parser.add_argument('--width', type=int,
+                    help="width of the aquarium (default: terminal width, or 80 when headless)")
+parser.add_argument('--height', type=int,
+                    help="height of the aquarium, in lines (default: terminal height, or 24 when headless)")
+parser.add_argument('--seed', type=seed_number,
+                    help="seed for everything random (default: a random seed)")
+parser.add_argument('--record', metavar='FILE',
+                    help="save the seed, size and a hash of every frame to FILE on exit")
+parser.add_argument('--replay', metavar='FILE',
+                    help="re-run a recorded session without output, and check its frame hashes")
+parser.add_argument('--profile', metavar='FILE', nargs='?', const='aquarium_profile.json',
+                    help="time each part of the loop (shown with --verbose, and written to "
+                         "FILE on SIGUSR1, default: aquarium_profile.json)")
+parser.add_argument('--save', metavar='FILE',
+                    help="save the whole aquarium to FILE on exit")
+parser.add_argument('--restore', metavar='FILE',
+                    help="bring back an aquarium saved with --save (instead of making a new one)")
+args = parser.parse_args()
+
+# a recorded session decides the size, seed and options when replaying it
+replaying = None
+if args.replay:
+    replaying = json.load(open(args.replay))
+    args.width  = replaying['width']
+    args.height = replaying['height']
+    args.seed   = replaying['seed']
+    args.swarm  = replaying['swarm']
+    args.scroll = replaying.get('scroll', False)
+    args.world  = replaying.get('world')
+
+# a saved aquarium decides the size and seed (see SNAPSHOTS)
+# (a session recorded from a saved aquarium has it in the recording, to
+#  start the replay from)
+SNAPSHOT_MAGIC   = b'AQUA'
+SNAPSHOT_VERSION = 5
+SNAPSHOT_HEADER  = struct.Struct('<4sHHHq')     # magic, version, width, height, seed
+restoring = None
+if args.restore:
+    restoring = open(args.restore, 'rb').read()
+elif replaying is not None and 'snapshot' in replaying:
+    restoring = base64.b64decode(replaying['snapshot'])
+if restoring is not None:
+    saved_from = args.restore or args.replay
+    if not restoring.startswith(SNAPSHOT_MAGIC) or len(restoring) < SNAPSHOT_HEADER.size:
+        parser.error("{} is not a saved aquarium".format(saved_from))
+    magic, version, args.width, args.height, args.seed = \
+        SNAPSHOT_HEADER.unpack_from(restoring)
+    if version != SNAPSHOT_VERSION:
+        parser.error("{} was saved by a different version (format {}, not {})"
+                     .format(saved_from, version, SNAPSHOT_VERSION))
+
+# nothing gets printed to the terminal (for headless runs and benchmarks)
+headless = args.headless or args.benchmark is not None or replaying is not None
+
+
+# get size of terminal (unless given), or [default] for runs without one
+# (headless runs, benchmarks and replays), so they come out the same anywhere
+def terminal_size(what, default):
+    if headless:
+        return default
+    try:
+        return int( subprocess.check_output(['tput', what]) )
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        parser.error("can't get the size of the terminal (tput {}), "
+                     "give it with --width and --height".format(what))
 
-# get size of terminal
-WIDTH  = int( subprocess.check_output(['tput','cols']) )
-HEIGHT = int( subprocess.check_output(['tput','lines']) ) - 1
+WIDTH  = args.width or terminal_size('cols', 80)
+HEIGHT = (args.height or terminal_size('lines', 24)) - 1
 VOLUME = WIDTH * HEIGHT
+# the world the creatures swim in can be wider than the window (which looks
+# into it at camera_x), with more of everything in it
+WORLD_WIDTH = max(args.world or WIDTH, WIDTH)
+screens     = WORLD_WIDTH // WIDTH
+
+# seed everything random, so the same aquarium can be made again
+SEED = args.seed if args.seed is not None else random_int(0, 2**32 - 1)
+random_seed(SEED)
+random_blocks.seed(SEED)
+if swarm_random is not None:
+    swarm_random.seed( zlib.crc32("swarm {}".format(SEED).encode('utf-8')) & 0xffffffff )
+
+# terminal escape sequences
+CURSOR_HOME                     = "\x1b[H"
+SYNC_BEGIN                      = "\x1b[?2026h"
+SYNC_END                        = "\x1b[?2026l"
 
 
 #================================= CUSTOMIZE ===================================
@@ -39,6 +239,15 @@ VOLUME = WIDTH * HEIGHT
 #------------------------------- time and space --------------------------------
 # for screen refresh rate
 DELAY                           = 0.08
+# time the simulation moves forward in each step (independent of refresh rate)
+SIM_STEP                        = DELAY
+# when the simulation falls behind:  'catch-up' (run the missed steps, up to
+# max_catch_up each frame) or 'skip' (drop them)
+overrun_policy                  = 'catch-up'
+max_catch_up                    = 5
+# work each frame should fit in (detail is shed when frames run over, and
+# restored when there is room again -- see DetailController)
+frame_budget                    = DELAY
 # used for scaling time fish periodically take to swim towards a coral/kelp
 coral_search_time               = (WIDTH + HEIGHT) // 2
 # scale (for how much stuff (eg. kelp) can fit in the terminal width)
@@ -60,13 +269,40 @@ explorer_school                 = False
 word_bubbles                    = False     # "bubbles" must be True to work
 word_file                       = "/usr/share/dict/words"
 
-# print info about aquarium (can be toggled with ctrl-\)
+# move whole fish schools at once with numpy (see SwarmEngine)
+swarm_engine                    = False
+
+# simulate in a second process, so a slow terminal doesn't hold up the fish
+# (and the fish don't hold up the terminal) -- see SharedFrames
+split_processes                 = False
+
+# endless seabed, made a chunk at a time as it's scrolled into view with the
+# arrow keys (see Seabed), and how much of it to keep around
+scrolling_seabed                = False
+scroll_step                     = 8         # columns per key press
+seabed_cache_kb                 = 2048
+
+# print info about aquarium (can be toggled with ctrl-\ or v)
 verbose                         = False
 
+# how fast the simulation runs (change with + and -, pause with space)
+speed                           = 1.0
+paused                          = False
+
+# ask the terminal to show each frame all at once (never half-drawn)
+synchronized_output             = True
+
 # If set to a positive number, creatures can go outside of the "box"
 MARGIN_WATER                    = 50
 MARGIN_SAND                     = 5
 
+# creatures off the screen aren't drawn, and move less often the further off
+# they are (every 1 + distance // offscreen_blend loops, up to
+# offscreen_slowest), making up all the loops they missed at once
+offscreen_lod                   = True
+offscreen_blend                 = 16        # columns (or rows)
+offscreen_slowest               = 8         # loops
+
 
 #----------------------------------- colors ------------------------------------
 all_possible_colors = ['red','green','blue','cyan','magenta','yellow','white']
@@ -116,7 +352,6 @@ all_school_types = ['Monarch','Tree','Line','Circle','Neighbor','ShyNeighbor']
 #...............................................................................
 school_types                    = all_school_types
 max_fish                        = VOLUME // 200
-min_fish_per_school             = 5
 number_of_sea_monkey_schools    = randint( 2 , 5 )
 number_of_minnow_schools        = randint( 1 , number_of_sea_monkey_schools/2 )
 # ... independent swimmers
@@ -132,6 +367,22 @@ number_of_jellyfish             = randint( 4 , 10 )
 number_of_snails                = randint( 1 , 3*scale )
 number_of_sea_urchins           = randint( 1 , 2*scale )
 number_of_lobsters              = randint( 1 , 2*scale )
+# ... as many of everything for each screen's worth of world
+if screens > 1:
+    max_fish                     *= screens
+    number_of_sea_monkey_schools *= screens
+    number_of_minnow_schools     *= screens
+    number_of_whales             *= screens
+    number_of_baby_whales        *= screens
+    number_of_barracudas         *= screens
+    number_of_tuna               *= screens
+    number_of_angelfish          *= screens
+    number_of_minnows            *= screens
+    number_of_seamonkeys         *= screens
+    number_of_jellyfish          *= screens
+    number_of_snails             *= screens
+    number_of_sea_urchins        *= screens
+    number_of_lobsters           *= screens
 
 #===============================================================================
 
@@ -141,8 +392,14 @@ number_of_lobsters              = randint( 1 , 2*scale )
 
 #------------------------- SPECIAL HANDLING FUNCTIONS --------------------------
 
+# process running the simulation (when it's split from drawing, see run_split)
+simulation_process = None
+
 # catch SIGINT ( ctrl-c )
 def signal_SIGINT_handler(signum, frame):
+    # (Stop the simulation process first, if there is one)
+    if simulation_process is not None:
+        stop_simulation()
     # (Show the cursor again)
     os.system('echo "\x1b[?25h"')
     os.system('tput sgr0')
@@ -151,28 +408,270 @@ signal.signal(signal.SIGINT, signal_SIGINT_handler)
 
 # catch SIGQUIT ( ctrl-\ )
 def signal_SIGQUIT_handler(signum, frame):
+    toggle_verbose()
+signal.signal(signal.SIGQUIT, signal_SIGQUIT_handler)
+
+def toggle_verbose():
     global verbose
     # Toggle verbosity (info about aquarium)
     verbose = not verbose
-signal.signal(signal.SIGQUIT, signal_SIGQUIT_handler)
+    # (repaint everything, so the info printout doesn't stay on screen)
+    if not verbose:
+        Aquarium.invalidate()
+
+# timings of each part of the loop (when profiling, see PhaseProfiler)
+profiler = None
+
+# catch SIGUSR1 ( kill -USR1 <pid> )
+def signal_SIGUSR1_handler(signum, frame):
+    # Write out the timings of each part of the loop (if profiling)
+    if profiler is not None:
+        profiler.dump(args.profile)
+signal.signal(signal.SIGUSR1, signal_SIGUSR1_handler)
+
+# catch SIGWINCH ( terminal resized )
+def signal_SIGWINCH_handler(signum, frame):
+    # Repaint everything on the next frame
+    try:
+        Aquarium.invalidate()
+    except NameError:
+        pass
+signal.signal(signal.SIGWINCH, signal_SIGWINCH_handler)
 
 def debug_printout():
-    subprocess.call(['tput', 'cup', '0', '0'])
-    print("reduce_clock:  {}".format(reduce_clock))
-    print("frame time:    {}".format((t_b - t_a)))
-    print()
-    print("{:12}  {:4}  {}".format("SCHOOL TYPE", "SIZE", "COLOR"))
-    print("{}".format(28*"-"))
+    lines = []
+    lines.append("detail level:  {}/{}  {}".format( detail.level, len(detail.levels)-1,
+                                                    detail.describe() ))
+    lines.append("frame time:    {:.4f}  (work, not counting sleep)".format(pacer.work))
+    lines.append("jitter:        {:.4f}  (max {:.4f})".format(pacer.jitter, pacer.max_jitter))
+    lines.append("overruns:      {}  (steps skipped: {})".format(pacer.overruns, pacer.skipped))
+    lines.append("speed:         x{:g}{}".format(speed, "  (paused)" if paused else ""))
+    lines.append("draws:         {}  (last loop, for {} creatures and bubbles)".format(
+                 Aquarium.draws, len(ecosystem.things)))
+    lines.append("cell writes:   {}  (last loop, {} cells with creatures on them)".format(
+                 Aquarium.writes, len(Aquarium.shown)))
+    if seabed is not None:
+        lines.append("seabed:        x={}  ({} chunks cached, {:.0f}kB, {} made)".format(
+                     view_x, len(seabed.cache), seabed.bytes / 1024.0, seabed.made))
+    if WORLD_WIDTH > WIDTH:
+        lines.append("world:         x={} of {}  ({} on screen, of {})".format(
+                     camera_x, WORLD_WIDTH - WIDTH,
+                     sum(1 for creature in ecosystem.things if detail.distance(creature) == 0),
+                     len(ecosystem.things)))
+    if profiler is not None:
+        lines.append("")
+        lines.append("{:26}  {:>7}  {:>7}  {:>7}  (ms)".format("PHASE", "p50", "p95", "p99"))
+        lines.append("{}".format(58*"-"))
+        for name in profiler.names:
+            p50, p95, p99 = profiler.percentiles(name, (50, 95, 99))
+            lines.append("{:26}  {:7.3f}  {:7.3f}  {:7.3f}".format(
+                            name, 1000*p50, 1000*p95, 1000*p99))
+    lines.append("")
+    lines.append("{:12}  {:4}  {}".format("SCHOOL TYPE", "SIZE", "COLOR"))
+    lines.append("{}".format(28*"-"))
     for school in schools:
         try:
             color = school.students[0].color
         except:
             color = ''
 
-        print("{:12}  {:4}  {}".format( school.__class__.__name__, 
-                                        len(school.students),
-                                        color,
-                                        school.following_order, ))
+        lines.append("{:12}  {:4}  {}".format( school.__class__.__name__, 
+                                               len(school.students),
+                                               color,
+                                               school.following_order, ))
+    Aquarium.write( CURSOR_HOME + "\n".join(lines) + "\n" )
+
+#-------------------------------- GLYPH CACHE ----------------------------------
+
+# matches the color codes termcolor puts around each character
+ANSI_ESCAPE = re.compile('\x1b\\[[0-9;]*m')
+
+# Every glyph (a character in a color) gets a small number, its code, the
+# first time it's used.  The stage is rows of codes (see glyph_row), and the
+# escape codes only come into it when a frame is printed (see Window.display)
+glyph_text  = []        # code -> the colored text that's printed for it
+glyph_chars = []        # code -> the character, without the colors
+glyph_codes = {}        # colored text -> code
+
+# (2 bytes for each cell of the stage)
+GLYPH_TYPECODE = 'H'
+
+# get the code for a colored character (giving it one if it's new)
+def glyph_code(text):
+    try:
+        return glyph_codes[text]
+    except KeyError:
+        code = glyph_codes[text] = len(glyph_text)
+        glyph_text.append(text)
+        glyph_chars.append( ANSI_ESCAPE.sub('', text) )
+        return code
+
+# a row of the stage, from glyph codes
+def glyph_row(codes):
+    return array(GLYPH_TYPECODE, codes)
+
+# (an empty cell)
+BLANK = glyph_code(' ')
+
+# Codes of the pre-colored characters for one color (colored() only runs
+# once per character)
+class GlyphTable(dict):
+    def __init__(self, color, attrs=()):
+        dict.__init__(self)
+        self.color = color
+        self.attrs = attrs
+
+    def __missing__(self, char):
+        glyph = self[char] = glyph_code( colored(char, self.color, attrs=list(self.attrs)) )
+        return glyph
+
+# Same as GlyphTable, but calls colored() every time (for benchmarking)
+class UncachedGlyphTable(GlyphTable):
+    def __missing__(self, char):
+        return glyph_code( colored(char, self.color, attrs=list(self.attrs)) )
+
+glyph_tables = {}
+
+# get the (shared) table of pre-colored characters for a color and attributes
+def glyphs(color, attrs=()):
+    try:
+        return glyph_tables[(color, attrs)]
+    except KeyError:
+        table = glyph_tables[(color, attrs)] = GlyphTable(color, attrs)
+        return table
+
+#-------------------------------- SPRITE CACHE ---------------------------------
+
+# A picture, compiled once:  its size, and the cells that aren't see-through
+# every sprite there is, by its code (see EntityStore)
+all_sprites = []
+
+class Sprite(object):
+    def __init__(self, picture, transparent=' ', facing=None):
+        self.code = len(all_sprites)
+        all_sprites.append(self)
+        # (some pictures can come back empty, eg. between jellyfish strokes)
+        self.picture = picture or ('',)
+        self.transparent = transparent
+        # which picture it is ('left', 'right', or 'image')
+        self.facing = facing
+        self.size = [ len(self.picture), len(self.picture[0]) ]
+
+        # mask of which cells get drawn, and a list of those cells (y, x, char)
+        self.mask = []
+        self.cells = []
+        # span of drawn columns [start, end) in each row that has any (y, start, end)
+        self.spans = []
+        # runs of drawn cells next to each other (y, start, end), for blit
+        self.runs = []
+        for y in range( self.size[0] ):
+            self.mask.append( [char != transparent for char in self.picture[y]] )
+            drawn = [ x for x in range( len(self.picture[y]) ) if self.mask[y][x] ]
+            for x in drawn:
+                self.cells.append( (y, x, self.picture[y][x]) )
+            if drawn:
+                self.spans.append( (y, drawn[0], drawn[-1] + 1) )
+            for x in drawn:
+                if self.runs and self.runs[-1][0] == y and self.runs[-1][2] == x:
+                    self.runs[-1][2] = x + 1
+                else:
+                    self.runs.append( [y, x, x + 1] )
+        self.runs = [ tuple(run) for run in self.runs ]
+
+        # the runs' glyph codes in each color (see runCodes)
+        self.run_codes = {}
+
+    # The runs, with the glyph codes of their cells in a color:
+    # [ (y, start, end, codes) ]
+    def runCodes(self, color):
+        try:
+            return self.run_codes[color]
+        except KeyError:
+            glyph = glyphs(color)
+            runs = self.run_codes[color] = [
+                (y, start, end, glyph_row([ glyph[char] for char in self.picture[y][start:end] ]))
+                for y, start, end in self.runs ]
+            return runs
+
+# (what things have before they're drawn the first time)
+blank_sprite = Sprite(None)
+
+sprites = {}
+
+# get the compiled sprite for a thing's picture ('left', 'right', or 'image')
+def get_sprite(thing, facing):
+    key = (thing.__class__, facing, thing.spriteState())
+    try:
+        return sprites[key]
+    except KeyError:
+        sprite = sprites[key] = Sprite( getattr(thing, facing)(), thing.transparent, facing )
+        return sprite
+
+# heights and widths of every sprite, by code, as a numpy array (made again
+# when there are new sprites)
+sprite_size_table = None
+
+def sprite_sizes():
+    global sprite_size_table
+    if sprite_size_table is None or len(sprite_size_table) < len(all_sprites):
+        sprite_size_table = np.array([ sprite.size for sprite in all_sprites ], dtype=int)
+    return sprite_size_table
+
+#----------------------------------- BLITS -------------------------------------
+
+# Copy a sprite, in a color, onto rows of glyph codes with its top left
+# corner at (top, left), a run of cells at a time:  bounds is the rows
+# [y_min, y_max) and columns [x_min, x_max) it can go on, and each run is
+# clipped to them once and copied as a slice.  The same cells are marked
+# True in any cover rows given.
+def blit(rows, sprite, color, top, left, bounds, covers=()):
+    y_min, y_max, x_min, x_max = bounds
+    for y, start, end, codes in sprite.runCodes(color):
+        y += top
+        if y < y_min or y >= y_max:
+            continue
+        a = max(start + left, x_min)
+        b = min(end + left, x_max)
+        if a >= b:
+            continue
+        rows[y][a:b] = codes[a - start - left : b - start - left]
+        for cover in covers:
+            cover[y][a:b] = [True] * (b - a)
+
+# The cells of sprites, in each color they're drawn in, kept together in flat
+# numpy arrays (for Window.composite to draw a lot of things at once):  each
+# (sprite, color) gets a number, and its cells are [length] long from [start]
+class CellTable(object):
+    def __init__(self):
+        self.numbers = {}       # (sprite code, color) -> number
+        self.cells   = []       # number -> [ (y, x, glyph code) ]
+        self.sizes   = []       # number -> (height, width)
+        self.arrays  = None     # (made again when there are new ones, see flat())
+
+    def number(self, sprite, color):
+        key = (sprite.code, color)
+        try:
+            return self.numbers[key]
+        except KeyError:
+            glyph = glyphs(color)
+            self.numbers[key] = len(self.cells)
+            self.cells.append( [ (y, x, glyph[char]) for y, x, char in sprite.cells ] )
+            self.sizes.append( sprite.size )
+            self.arrays = None
+            return self.numbers[key]
+
+    # (start, length, height, width, ys, xs, glyph codes)
+    def flat(self):
+        if self.arrays is None:
+            length = np.array([ len(cells) for cells in self.cells ], dtype=int)
+            cells = np.array([ cell for cells in self.cells for cell in cells ],
+                             dtype=int).reshape(-1, 3)
+            sizes = np.array(self.sizes, dtype=int).reshape(-1, 2)
+            self.arrays = ( np.cumsum(length) - length, length, sizes[:,0], sizes[:,1],
+                            cells[:,0], cells[:,1], cells[:,2] )
+        return self.arrays
+
+cell_table = CellTable()
 
 #---------------------------- FUNCTION DECORATORS ------------------------------
 
@@ -199,7 +698,7 @@ def speed_check_after(movement_function):
 def turn_around_water(movement_function):
     def wrapper(self, *args, **kwargs):
         left_wall   = 1 - MARGIN_WATER
-        right_walL  = WIDTH + MARGIN_WATER
+        right_walL  = WORLD_WIDTH + MARGIN_WATER
         top_wall    = Water.position + 1
         bottom_waLL = HEIGHT - 1
         #--------------------------------------------------------------------------------
@@ -225,7 +724,7 @@ def turn_around_water(movement_function):
 def turn_around_sand(movement_function):
     def wrapper(self, *args, **kwargs):
         left_wall   = 1 - MARGIN_SAND
-        right_walL  = WIDTH + MARGIN_SAND
+        right_walL  = WORLD_WIDTH + MARGIN_SAND
         top_wall    = Sand.position + 1
         bottom_waLL = HEIGHT - 1
         #--------------------------------------------------------------------------------
@@ -252,6 +751,15 @@ def turn_around_sand(movement_function):
 ################################################################################
 ################################### CLASSES ####################################
 
+# How far in front each layer of the picture is:  something with a bigger
+# depth covers up anything with a smaller one (see Window.composite)
+DEPTH_BACKGROUND    = 0     # water, sand, and the scenery at the back
+DEPTH_BOTTOMFEEDERS = 1
+DEPTH_MIDGROUND     = 2     # coral and kelp in front of the bottomfeeders
+DEPTH_SWIMMERS      = 3
+DEPTH_BUBBLES       = 4
+DEPTH_FOREGROUND    = 5     # long kelp and dunes at the very front
+
 # Display of the aquarium
 class Window(object):
     def __init__(self, border_color):
@@ -259,42 +767,341 @@ class Window(object):
         self.width = WIDTH
         self.height = HEIGHT
 
-        # create lists for "screen"
+        # rows of glyph codes for the "screen" (see glyph_code)
         self.stage = []
         self.background = []
 
         # clear screen
-        os.system('clear')
+        if not headless:
+            os.system('clear')
 
         # create blank aquarium box
         for y in range(self.height):
-            self.stage.append([" "] * self.width)
+            self.stage.append( glyph_row([BLANK] * self.width) )
 
         #draw aquarium border
+        glyph = glyphs(self.border_color)
         for y in range(0, self.height):
             for x in range(0, self.width):
                 #top
-                self.stage[0][x] = \
-                        colored( "=", self.border_color )
+                self.stage[0][x] = glyph["="]
                 #bottom
-                self.stage[self.height-1][x] = \
-                        colored( "=", self.border_color )
+                self.stage[self.height-1][x] = glyph["="]
                 #left
-                self.stage[y][0] = \
-                        colored( "|", self.border_color )
+                self.stage[y][0] = glyph["|"]
                 #right
-                self.stage[y][self.width-1] = \
-                        colored( "|", self.border_color )
+                self.stage[y][self.width-1] = glyph["|"]
+
+        # cells covered by scenery in front of each layer of creatures
+        # (see bake_scenery)
+        self.cover = { 'midground'  : self.blankMask(),
+                       'foreground' : self.blankMask() }
+        # depth of the scenery in each cell (see bakeDepth), and the same as one
+        # numpy array, made when it's needed after it changes (see depthCells)
+        self.depth = [ [DEPTH_BACKGROUND] * self.width for y in range(self.height) ]
+        self.depth_cells = None
+        # cells with a creature (or bubble) on them, as y*width + x, and the
+        # glyph there (see composite)
+        self.shown = {}
+        # rows drawn in the last batch, and which way they were going
+        # (see compositeBatch)
+        self.pictured = None
+
+        # last frame sent to the terminal (None means repaint everything)
+        self.last_frame = None
+
+        # things drawn so far in this loop, and cells of the stage written
+        # for them (see composite)
+        self.draws = 0
+        self.writes = 0
+
+        # parts of the stage changed since the last frame, as a span of
+        # columns [start, end) for each row that was touched
+        self.dirty = {}
+
+    def blankMask(self):
+        return [ [False] * self.width for y in range(self.height) ]
+
+    # Mask of the cells a list of things is drawn on (added to an existing mask)
+    def coverMask(self, things, mask=None):
+        mask = [ row[:] for row in (mask or self.blankMask()) ]
+        for thing in things:
+            for y, x in thing.drawnCells():
+                mask[y][x] = True
+        return mask
+
+    # Work out the depth of the scenery in each cell from the covers (after
+    # they change):  anything behind it there is covered up
+    def bakeDepth(self):
+        for y in range(self.height):
+            self.depth[y] = self.depthOf( self.cover['midground'][y],
+                                          self.cover['foreground'][y] )
+        self.depth_cells = None
+
+    # The depth of the scenery in every cell, as y*width + x
+    def depthCells(self):
+        if self.depth_cells is None:
+            self.depth_cells = np.array(self.depth, dtype=int).reshape(-1)
+        return self.depth_cells
+
+    # Depth of the scenery along a row (or part of one), from the covers
+    def depthOf(self, midground, foreground):
+        return [ DEPTH_FOREGROUND if front else
+                 DEPTH_MIDGROUND if middle else DEPTH_BACKGROUND
+                 for middle, front in zip(midground, foreground) ]
+
+    # Draw things on the stage, in front of or behind the scenery and each other
+    # by their depth, whatever order they come in.  Each thing's cells are
+    # resolved against a per-cell depth buffer first, and then each cell of the
+    # stage is written at most once:  the ones that now show something else,
+    # and the ones nothing is on any more (which go back to the background)
+    # (with [batched], all the cells are resolved at once, see compositeBatch)
+    def composite(self, things, batched=None):
+        if batched is not None:
+            return self.compositeBatch(things, *batched)
+        scenery = self.depth
+        width = self.width
+        bottom = self.height - 1
+        right = width - 1
+        # depth of what is in front in each cell so far, and its glyph
+        # (things of the same depth:  the later one in the list is in front)
+        zbuffer = {}
+        front = {}
+        count = len(things)
+        for index, thing in enumerate(things):
+            self.draws += 1
+            at = thing.place()
+            if at is None:
+                thing.drawn = None
+                continue
+            top, left = at
+            depth = thing.depth
+            key = depth * count + index
+            glyph = glyphs(thing.color)
+            for y, x, char in thing.sprite.cells:
+                y += top
+                x += left
+                if 0 < y < bottom and 0 < x < right and scenery[y][x] <= depth:
+                    cell = y * width + x
+                    if zbuffer.get(cell, -1) < key:
+                        zbuffer[cell] = key
+                        front[cell] = glyph[char]
+            thing.drawn = thing.sprite
+        self.writeFront(front)
+
+    # The same as composite, with numpy:  the things at [index] in the list
+    # are drawn straight from their [rows] in the entity store's columns
+    # (without going through them one by one), and [keys] are their depth *
+    # len(things) + index.  Every cell of everything goes through the depth
+    # test against the scenery and the depth buffer together.
+    # (the students of the swarm engine, whose pictures only change with
+    # their direction)
+    def compositeBatch(self, things, index, rows, keys):
+        width = self.width
+        bottom = self.height - 1
+        right = width - 1
+        count = len(things)
+        self.draws += count
+
+        # the rest, one by one
+        loose = np.ones(count, dtype=bool)
+        loose[index] = False
+        tops, lefts, numbers, loose_keys = [], [], [], []
+        for i in np.flatnonzero(loose).tolist():
+            thing = things[i]
+            at = thing.place()
+            if at is None:
+                thing.drawn = None
+                continue
+            tops.append(at[0])
+            lefts.append(at[1])
+            numbers.append( cell_table.number(thing.sprite, thing.color) )
+            loose_keys.append( thing.depth * count + i )
+            thing.drawn = thing.sprite
+
+        # the batch, from the columns (with a new picture for whoever turned
+        # since the last time, see MovingThing.getPicture)
+        ecosystem.refresh()
+        column = ecosystem.numbers
+        dy, dx = column('dy')[rows], column('dx')[rows]
+        last = self.pictured
+        if last is not None and last[0] is rows:
+            turned = np.flatnonzero( (dy != last[1]) | (dx != last[2]) )
+        else:
+            turned = np.arange(len(rows))
+        self.pictured = (rows, dy, dx)
+        for i in index[turned].tolist():
+            things[i].getPicture()
+        ecosystem.refresh()
+        sprite, color = column('sprite')[rows], column('color')[rows]
+        top, left = column('y')[rows], column('x')[rows] - camera_x
+        # (a number in the cell table for each sprite and color there is)
+        names = len(ecosystem.names)
+        pairs, which = np.unique( sprite.astype(np.int64) * names + color,
+                                  return_inverse=True )
+        batch = np.array([ cell_table.number(all_sprites[pair // names],
+                                             ecosystem.name(pair % names))
+                           for pair in pairs.tolist() ], dtype=int)[ which.reshape(-1) ]
+
+        start, length, height, width_of, ys, xs, codes = cell_table.flat()
+        # (off the screen, the same as Thing.place)
+        on = (left < right) & (left + width_of[batch] > 1) & \
+             (top < bottom) & (top + height[batch] > 1)
+        tops    = np.concatenate([ np.array(tops, dtype=int), top[on] ])
+        lefts   = np.concatenate([ np.array(lefts, dtype=int), left[on] ])
+        numbers = np.concatenate([ np.array(numbers, dtype=int), batch[on] ])
+        key     = np.concatenate([ np.array(loose_keys, dtype=int), keys[on] ])
+
+        # every cell of every thing
+        n = length[numbers]
+        owner = np.repeat(np.arange(len(numbers)), n)
+        at = np.arange(n.sum()) + np.repeat(start[numbers] - (np.cumsum(n) - n), n)
+        y = tops[owner] + ys[at]
+        x = lefts[owner] + xs[at]
+        key = key[owner]
+        inside = (y > 0) & (y < bottom) & (x > 0) & (x < right)
+        cell, key, code = (y * width + x)[inside], key[inside], codes[at][inside]
+        shows = self.depthCells()[cell] <= key // count
+        cell, key, code = cell[shows], key[shows], code[shows]
+
+        # (the one in front in each cell)
+        zbuffer = np.full(width * self.height, -1, dtype=int)
+        np.maximum.at(zbuffer, cell, key)
+        front = zbuffer[cell] == key
+        self.writeFront( dict(zip( cell[front].tolist(), code[front].tolist() )) )
+
+    # Put the glyphs in front in each cell on the stage (and the background
+    # back where nothing is any more), writing only the cells that change
+    def writeFront(self, front):
+        width = self.width
+        stage = self.stage
+        background = self.background
+        for cell in self.shown:
+            if cell not in front:
+                y, x = divmod(cell, width)
+                if stage[y][x] != background[y][x]:
+                    stage[y][x] = background[y][x]
+                    self.touch(y, x, x + 1)
+                    self.writes += 1
+        for cell, char in front.items():
+            y, x = divmod(cell, width)
+            if stage[y][x] != char:
+                stage[y][x] = char
+                self.touch(y, x, x + 1)
+                self.writes += 1
+        self.shown = front
+
+    # Mark columns [start, end) of a row as changed
+    def touch(self, y, start, end):
+        if start < 0:
+            start = 0
+        if end > self.width:
+            end = self.width
+        if start >= end or not 0 <= y < self.height:
+            return
+        span = self.dirty.get(y)
+        if span is None:
+            self.dirty[y] = [start, end]
+        else:
+            if start < span[0]:
+                span[0] = start
+            if end > span[1]:
+                span[1] = end
+
+    # Mark the cells of a sprite at a position as changed
+    def touchSprite(self, sprite, top, left):
+        for y, start, end in sprite.spans:
+            self.touch(top + y, left + start, left + end)
+
+    # Number of cells marked as changed
+    def dirtyCells(self):
+        return sum( end - start for start, end in self.dirty.values() )
+
+    # Start over with nothing changed (at the end of a frame)
+    def clean(self):
+        self.dirty = {}
 
     def display(self):
-        # Move cursor back to top left
-        os.system('tput cup 0 0')
-        # print
+        # repaint everything the first time (or after a resize), and after
+        # that only the cells that changed since the last frame
+        if self.last_frame is None:
+            self.repaint()
+            # remember what is on the terminal now, to compare the next frame to
+            self.last_frame = [ row[:] for row in self.stage ]
+        else:
+            self.repaint_changes()
+        self.clean()
+
+    # Print the whole stage
+    def repaint(self):
+        # Move cursor back to top left, then print every row
+        output = [CURSOR_HOME]
         for row in range( len(self.stage) ):
-            print("".join(self.stage[row]))
+            output.append( self.text(self.stage[row]) )
+            output.append("\n")
+        self.write_frame("".join(output))
+
+    # Print only the runs of cells that are different from the last frame
+    # (only looking at the parts of the stage that were touched)
+    def repaint_changes(self):
+        output = []
+        for y in sorted(self.dirty):
+            span_start, span_end = self.dirty[y]
+            row = self.stage[y]
+            last_row = self.last_frame[y]
+            x = span_start
+            while x < span_end:
+                if row[x] != last_row[x]:
+                    start = x
+                    while x < span_end and row[x] != last_row[x]:
+                        x += 1
+                    # move cursor to the start of the run, then print the run
+                    output.append( "\x1b[{};{}H".format(y+1, start+1) )
+                    output.append( self.text(row[start:x]) )
+                x += 1
+            # remember what is on the terminal now, to compare the next frame to
+            last_row[span_start:span_end] = row[span_start:span_end]
+        self.write_frame("".join(output))
+
+    # What to print for some glyph codes (with their colors)
+    def text(self, codes):
+        return "".join([ glyph_text[code] for code in codes ])
+
+    # Send a frame to the terminal in one go
+    def write_frame(self, text):
+        if synchronized_output:
+            text = SYNC_BEGIN + text + SYNC_END
+        self.write(text)
+
+    # Write straight to the terminal (one syscall, unless it's a partial write)
+    def write(self, text):
+        # (anything still sitting in python's buffer has to go out first)
+        sys.stdout.flush()
+        data = memoryview( text.encode('utf-8') )
+        fd = sys.stdout.fileno()
+        while len(data) > 0:
+            data = data[ os.write(fd, data): ]
+
+    # Forget the last frame, so the next one is repainted completely
+    def invalidate(self):
+        self.last_frame = None
 
 # Things that can be drawn in the aquarium
 class Thing(object):
+    # (no __dict__ for each thing, only these -- and whatever subclasses add)
+    # sprite is the current sprite, drawn is the last sprite that was drawn
+    # (None if it wasn't on the screen), and entity is its id in the
+    # EntityStore (if any)
+    __slots__ = ('position', 'direction', 'color', 'size', 'picture', 'sprite', 'drawn',
+                 'entity')
+
+    # character that is see-through in the pictures
+    transparent = ' '
+    # how far in front it is (see DEPTH_BACKGROUND)
+    depth = DEPTH_SWIMMERS
+    # anything besides position, direction, speed and color to save (see SNAPSHOTS)
+    snapshot_fields = ()
+
     def __init__(self, position, color):
         self.position = position
         self.color = color
@@ -302,73 +1109,101 @@ class Thing(object):
         # self.direction = [0,0]
         self.size = [0,0]
         self.picture = ['']
+        self.sprite = blank_sprite
+        self.drawn = None
+        self.entity = None
+
+    # Anything besides the direction that changes the picture (for animations)
+    def spriteState(self):
+        return None
 
     # Get the picture of the object in question, and assign LEFT or RIGHT picture
     def getPicture(self):
-        #self.picture = self.right()
+        sprite = self.sprite
         if self.direction[1] < 0:
-            self.picture = self.left()
+            sprite = get_sprite(self, 'left')
         elif self.direction[1] > 0:
-            self.picture = self.right()
-        # Get size of the object's picture
-        try:
-            self.size = [ len(self.picture), len(self.picture[0]) ]
-        except:
-            self.size = [0,0]
-
-    # Draw the object
-    def draw(self):
+            sprite = get_sprite(self, 'right')
+        # (its row in the entity store has the sprite too, see EntityStore)
+        if sprite is not self.sprite:
+            self.sprite = sprite
+            ecosystem.moved.add(self)
+        # Get picture and size of the object's sprite
+        self.picture = self.sprite.picture
+        self.size = self.sprite.size
+
+    # Get the picture, and where on the screen it goes:  (top, left), or None
+    # when it's off the screen
+    def place(self):
         self.getPicture()
-        for y in range( self.size[0] ):
-            for x in range( self.size[1] ):
-                if  y + self.position[0] > 0 and \
-                    y + self.position[0] < (HEIGHT-1) and \
-                    x + self.position[1] > 0 and \
-                    x + self.position[1] < (WIDTH-1) and \
-                    self.picture[y][x] != " " :          # Avoids drawing a blank box around thing
-                        Aquarium.stage[ int(y + self.position[0]) ]\
-                                      [ int(x + self.position[1]) ] \
-                        = colored(self.picture[y][x], self.color)
-
-    # Remove object (for when it's moving)
-    def erase(self):
+        top  = int(self.position[0])
+        left = int(self.position[1]) - camera_x
+        if left >= WIDTH - 1 or left + self.size[1] <= 1 or \
+           top >= HEIGHT - 1 or top + self.size[0] <= 1:
+            return None
+        return (top, left)
+
+    # Draw the object straight onto the stage, over whatever is there (scenery
+    # is drawn this way, back to front, and creatures by Window.composite)
+    def draw(self):
+        at = self.place()
+        # (nothing to do when it's off the screen)
+        if at is None:
+            self.drawn = None
+            return
+        top, left = at
+        # (only the cells that aren't blank, to avoid drawing a box around thing)
+        blit(Aquarium.stage, self.sprite, self.color, top, left, (1, HEIGHT-1, 1, WIDTH-1))
+        Aquarium.touchSprite(self.sprite, top, left)
+        self.drawn = self.sprite
+
+    # Cells of the stage that draw() would draw on
+    def drawnCells(self):
         self.getPicture()
-        for y in range( self.size[0] ):
-            for x in range( self.size[1] ):
-                if  y + self.position[0] > 0 and \
-                    y + self.position[0] < (HEIGHT-1) and \
-                    x + self.position[1] > 0 and \
-                    x + self.position[1] < (WIDTH-1) :
-                        Aquarium.stage[ int(y + self.position[0]) ]\
-                                      [ int(x + self.position[1]) ] \
-                        = Aquarium.background[ int(y + self.position[0]) ]\
-                                             [ int(x + self.position[1]) ]
+        top  = int(self.position[0])
+        left = int(self.position[1]) - camera_x
+        return [ (y + top, x + left) for y, x, char in self.sprite.cells
+                 if 0 < y + top < (HEIGHT-1) and 0 < x + left < (WIDTH-1) ]
 
 #------------------------------- MOVING THINGS ---------------------------------
 
 # Moving things (animals, bubbles, ships)
 class MovingThing(Thing):
+    # grids is the spatial grids this thing is indexed in (see SpatialGrid)
+    __slots__ = ('speed', 'grids')
+    # (the same for every one of a kind)
+    maxspeed = 1
+
     def __init__(self, position, color):
-        self.position = position    # [y,x]
+        # (Initial null values for each object, so that it can be drawn the first time)
+        Thing.__init__(self, position, color)    # position is [y,x]
         self.speed = 1
-        self.maxspeed = 1
-        self.color = color
+        self.grids = ()
 
         # Initiate a start direction of left or right (if direction starts as [0,0]...
         # ... then calmRandomMove objects will stay still)
         self.direction = [0, choice([-1,1])]    # [y,x]
-        
-        # Initial null values for each object, so that it can be drawn the first time
-        self.size = [0,0]
-        self.picture = ['']
 
-    # Move object
+    # Move object (it's drawn where it ends up by render(), once a loop,
+    # however many times it moved)
     def move(self):
-        # Erase current, increment, draw new
-        self.erase()
         self.position[0] += int( self.direction[0] * self.speed )
         self.position[1] += int( self.direction[1] * self.speed )
-        self.draw()
+        self.reindex()
+
+    # Make up for [steps] loops at once, going the way it's going (for things
+    # far off the screen, see DetailController.steps)
+    def coast(self, steps):
+        speed = self.speed
+        self.speed = speed * steps
+        self.move()
+        self.speed = speed
+
+    # Let the spatial grids (and the entity store) know the position has changed
+    def reindex(self):
+        for grid in self.grids:
+            grid.update(self)
+        ecosystem.moved.add(self)
 
     # Keep speed from exploding
     def controlSpeed(self):
@@ -409,13 +1244,17 @@ class MovingThing(Thing):
 
         return (dy, dx_tail, dx_front, distance_tail_sq, distance_front_sq)
 
-    # Find nearest individual in a group (list)
+    # Find nearest individual in a group (list, or SpatialGrid)
     def findNearest(self, group, *arg):
         if len(arg) > 0:
             side = str(arg[0])
         else:
             side = 'tail'
 
+        # large groups (schools) are indexed in a grid
+        if isinstance(group, SpatialGrid):
+            return group.findNearest(self, side)
+
         if side.lower() in ['front', 'mouth']:      # look for front (mouth)
             side_index = 4
         else:                                       # look for tail
@@ -431,8 +1270,8 @@ class MovingThing(Thing):
         # Go through list, and if a member is nearer the previous nearest, replace nearest_member
         for member in group:
 
-            if member == self:                      # ignore self (don't find distance)
-                pass
+            if member is self:                      # ignore self (don't find distance)
+                continue
 
             # getDistance() returns :
             # [dy, dx_tail, dx_front, distance_tail_sq, distance_front_sq]
@@ -441,6 +1280,7 @@ class MovingThing(Thing):
                 pass
             elif dr_current < dr_previous:          # if current is nearer than previous nearest...
                 nearest_member = member
+                dr_previous = dr_current
 
         return nearest_member
 
@@ -492,7 +1332,7 @@ class MovingThing(Thing):
     @speed_check_before
     def follow(self, leader, distance):
         # variable for how much to accelerate when far from leader
-        self.accelerate = 1
+        accelerate = 1
 
         get_distances = self.getDistance(leader)
         # [dy, dx_tail, dx_front, distance_tail_sq, distance_front_sq]
@@ -508,14 +1348,14 @@ class MovingThing(Thing):
             if dx != 0:
                 self.direction[1] = ( dx//abs(dx) )
 
-            self.speed += self.accelerate       # Get back to leader
+            self.speed += accelerate            # Get back to leader
             # self.move()                       # Move straight to leader
 
     # Flee from an enemy (i.e. Predator)
     @speed_check_before
     def flee(self, enemy, distance):
         # variable for how much to accelerate when enemy is close
-        self.accelerate = 3
+        accelerate = 3
 
         get_distances = self.getDistance(enemy)
         # [dy, dx_tail, dx_front, distance_tail_sq, distance_front_sq]
@@ -531,7 +1371,7 @@ class MovingThing(Thing):
             if dx != 0:
                 self.direction[1] = -( dx//abs(dx) )
 
-            # self.speed += self.accelerate     # Get ready to flee quickly
+            # self.speed += accelerate          # Get ready to flee quickly
             self.move()                         # Move straight away from the enemy
             # self.speed = self.maxspeed
             self.move()                         # Move straight away from the enemy
@@ -554,13 +1394,16 @@ class MovingThing(Thing):
 
 # Debris that drifts (like bubbles, sinkers, etc.)
 class Debris(MovingThing):
-    # erase current, increment, draw new
-    def move(self):
-        if self.position[0] <= ( Water.position ):
-            MovingThing.move(self)
-            self.erase()
-        else:
-            MovingThing.move(self)
+    __slots__ = ()
+
+    # bubbles are in front of the swimmers
+    depth = DEPTH_BUBBLES
+
+    # (it pops when it gets up to the water, and isn't drawn any more)
+    def place(self):
+        if self.position[0] > Water.position:
+            return MovingThing.place(self)
+        return None
 
     # wiggle from left-to-right, randomly
     def drift(self):
@@ -571,12 +1414,19 @@ class Debris(MovingThing):
 
 # Fish (and whales etc.) -- things that swim around
 class Fish(MovingThing):
+    __slots__ = ()
+
     @turn_around_water
     def move(self):
         MovingThing.move(self)
 
 # Snails and Lobsters etc. -- things that move slowly on the ocean floor
 class BottomFeeder(MovingThing):
+    __slots__ = ()
+
+    # (midground coral and kelp are in front of bottomfeeders)
+    depth = DEPTH_BOTTOMFEEDERS
+
     @turn_around_sand
     def move(self):
         MovingThing.move(self)
@@ -585,9 +1435,12 @@ class BottomFeeder(MovingThing):
 
 # Fish (smallest)
 class SeaMonkey(Fish):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 2
+    __slots__ = ()
+    maxspeed = 2
+
+    # picture tilts up or down
+    def spriteState(self):
+        return (self.direction[0] > 0) - (self.direction[0] < 0)
     
     def left(self):
         if self.direction[0] < 0:
@@ -612,9 +1465,8 @@ class SeaMonkey(Fish):
 
 # Fish (small)
 class Minnow(Fish):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 2
+    __slots__ = ()
+    maxspeed = 2
 
     def left(self):
         return  (
@@ -627,9 +1479,8 @@ class Minnow(Fish):
 
 # Fish (medium)
 class AngelFish(Fish):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 1
+    __slots__ = ()
+    maxspeed = 1
 
     def left(self):
         return  (
@@ -642,9 +1493,8 @@ class AngelFish(Fish):
 
 # Fish (large)
 class Tuna(Fish):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 2
+    __slots__ = ()
+    maxspeed = 2
 
     def left(self):
         return  (
@@ -657,9 +1507,8 @@ class Tuna(Fish):
 
 # Fish (long)
 class Barracuda(Fish):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 2
+    __slots__ = ()
+    maxspeed = 2
 
     def left(self):
         return  (
@@ -673,12 +1522,20 @@ class Barracuda(Fish):
 
 # Clock - displays time in 12-hr format
 class Clock(Fish):
+    __slots__ = ('now',)
+    maxspeed = 2
+
     def __init__(self, position, color):
         MovingThing.__init__(self, position, color)
-        self.maxspeed = 2
+        self.now = datetime.now()
+
+    # new picture every minute
+    def spriteState(self):
+        self.now = datetime.now()
+        return (self.now.hour, self.now.minute)
 
     def left(self):
-        now         = datetime.now()
+        now         = self.now
         day         = now.day
         hour        = int(now.strftime('%I'))
         minute      = now.minute
@@ -688,7 +1545,7 @@ class Clock(Fish):
         '{}:{:02d} {}'.format(hour, minute, ampm),
         )
     def right(self):
-        now         = datetime.now()
+        now         = self.now
         day         = now.day
         hour        = int(now.strftime('%I'))
         minute      = now.minute
@@ -700,9 +1557,8 @@ class Clock(Fish):
 
 # Whale
 class Whale(Fish):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 1
+    __slots__ = ()
+    maxspeed = 1
 
     def left(self):
         return (                            
@@ -720,9 +1576,8 @@ class Whale(Fish):
 
 # Baby Whale
 class BabyWhale(Fish):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 1
+    __slots__ = ()
+    maxspeed = 1
 
     def left(self):
         return (                            
@@ -738,10 +1593,12 @@ class BabyWhale(Fish):
 
 # Jellyfish
 class Jellyfish(MovingThing):
+    __slots__ = ('bell_0', 'bell_1', 'bell_2', 'bell_3', 'bell')
+    snapshot_fields = __slots__
+    maxspeed = 1
+
     def __init__(self, position, color):
         MovingThing.__init__(self, position, color)
-        self.speed    = 1
-        self.maxspeed = 1
         # each jellyfish swims a little differently
         self.bell_0 = randint(6, 10)
         self.bell_1 = self.bell_0 + randint(1,3)
@@ -773,32 +1630,37 @@ class Jellyfish(MovingThing):
             MovingThing.move(self)
         else:
             # set direction back to horizontal
+            # (the bell is animated by render(), see spriteState)
             self.direction[0] = 0
-            MovingThing.erase(self)
-            MovingThing.draw(self)
 
         # increment bell counter
         self.bell = (self.bell+1) % self.bell_3
 
-    def left(self):
+    # part of the "stroke" the bell is in
+    def spriteState(self):
+        if detail.freeze_jellyfish:
+            return 0
         if self.bell < self.bell_0:
-            return self.left_0()
+            return 0
         elif self.bell < self.bell_1:
-            return self.left_1()
+            return 1
         elif self.bell < self.bell_2:
-            return self.left_2()
+            return 2
         elif self.bell < self.bell_3:
-            return self.left_3()
+            return 3
+
+    # (the picture has to be the one for spriteState, since that's what it's
+    #  cached under -- eg. resting while jellyfish are frozen)
+    # (and no picture at all right at the end of a stroke, like spriteState)
+    def left(self):
+        state = self.spriteState()
+        if state is not None:
+            return (self.left_0, self.left_1, self.left_2, self.left_3)[state]()
 
     def right(self):
-        if self.bell < self.bell_0:
-            return self.right_0()
-        elif self.bell < self.bell_1:
-            return self.right_1()
-        elif self.bell < self.bell_2:
-            return self.right_2()
-        elif self.bell < self.bell_3:
-            return self.right_3()
+        state = self.spriteState()
+        if state is not None:
+            return (self.right_0, self.right_1, self.right_2, self.right_3)[state]()
 
     def left_0(self):
         return (                            
@@ -837,9 +1699,8 @@ class Jellyfish(MovingThing):
 
 # Snail
 class Snail(BottomFeeder):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 1
+    __slots__ = ()
+    maxspeed = 1
 
     def left(self):
         return  (
@@ -852,9 +1713,8 @@ class Snail(BottomFeeder):
 
 # Sea Urchin
 class SeaUrchin(BottomFeeder):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 1
+    __slots__ = ()
+    maxspeed = 1
 
     def left(self):
         return (                            
@@ -872,18 +1732,27 @@ class SeaUrchin(BottomFeeder):
 
 # Lobster
 class Lobster(BottomFeeder):
-    def __init__(self, position, color):
-        MovingThing.__init__(self, position, color)
-        self.maxspeed = 1
+    __slots__ = ('claws',)
+    maxspeed = 1
 
-    def left(self):
+    # claws move now and then
+    def spriteState(self):
         if randint(0,20) == 1:
+            self.claws = 1
+        elif randint(0,20) == 2:
+            self.claws = 2
+        else:
+            self.claws = 0
+        return self.claws
+
+    def left(self):
+        if self.claws == 1:
             return (                            
             '\./  ',
             '>M=={',
             '     '       
             )
-        elif randint(0,20) == 2:
+        elif self.claws == 2:
             return (                            
             '_|.  ',
             '>M=={',
@@ -897,13 +1766,13 @@ class Lobster(BottomFeeder):
             )
 
     def right(self):
-        if randint(0,20) == 1:
+        if self.claws == 1:
             return (                            
             '  \./',
             '}==M<',
             '     '       
             )
-        elif randint(0,20) == 2:
+        elif self.claws == 2:
             return (                            
             '  .|_',
             '}==M<',
@@ -920,43 +1789,45 @@ class Lobster(BottomFeeder):
 
 # Bubbles!
 class Bubble(Debris):
+    # images is which pair of images it has (see image_pairs)
+    __slots__ = ('images', 'word')
+    snapshot_fields = __slots__
+    maxspeed = 1
+
+    # possible bubble images (left, right)
+    image_pairs = [ ('_left1', '_right1'),
+                    ('_left2', '_right2'),
+                    ('_left3', '_right3'),
+                    ('_words', '_words') ]
+
     def __init__(self, position, color):
         global word_bubbles
 
-        self.maxspeed = 1
-
         Debris.__init__(self, position, color)
-        self.position = position
-        self.color = color
         self.direction = [-1,0]     # float up
 
-        now              = datetime.now()
-        self.year        = now.year
-        self.month       = now.month
-        self.month_name  = now.strftime('%b')
-        self.day         = now.day
-        self.hour        = int(now.strftime('%I'))
-        self.minute      = now.minute
-        self.second      = now.second
-        self.ampm        = now.strftime('%p').lower()
-
         try:
             self.word = u"{}".format(choice(word_list)).replace("'s","")
         except:
             self.word = "puppies"
 
-        # choose between possible bubble images
-        self_images = [
-                        [self._left1, self._right1],
-                        [self._left2, self._right2],
-                        [self._left3, self._right3]
-                      ]
-
+        # choose between possible bubble images (words only if set)
         if word_bubbles == True:
-            self_images.append([self._words, self._words])
+            self.images = choice( range(4) )
+        else:
+            self.images = choice( range(3) )
 
+    def left(self):
+        return getattr( self, self.image_pairs[self.images][0] )()
 
-        self.left, self.right = choice(self_images)
+    def right(self):
+        return getattr( self, self.image_pairs[self.images][1] )()
+
+    # which set of bubble images (and which word) this bubble has
+    def spriteState(self):
+        if self.image_pairs[self.images][0] == '_words':
+            return (self.images, self.word)
+        return self.images
 
     # First set of bubble images
     def _left1(self):
@@ -998,17 +1869,19 @@ class Bubble(Debris):
 
     # Bubble shows the time
     def _clock(self):
+        now = datetime.now()
         #return  (
         #'{}:{:02d}:{:02d}'.format(hour, minute, second),
         #)
         return  (
-        '{}:{:02d} {}'.format(self.hour, self.minute, self.ampm),
+        '{}:{:02d} {}'.format(int(now.strftime('%I')), now.minute, now.strftime('%p').lower()),
         )
 
     # Bubble shows the date
     def _date(self):
+        now = datetime.now()
         return  (
-        '{} {}'.format(self.month_name, self.day),
+        '{} {}'.format(now.strftime('%b'), now.day),
         )
 
     # Random words
@@ -1021,22 +1894,29 @@ class Bubble(Debris):
 
 # Nonmoving things (sand features, rocks, etc.)
 class NonMovingThing(Thing):
+    __slots__ = ()
+    # (scenery is drawn back to front, then baked into the background, and
+    #  how far in front each part of it is goes in Window.depth)
+    depth = DEPTH_FOREGROUND
+
     def __init__(self, position, color):
         # self.size = size          # [y,x]
-        self.position = position    # [y,x]
-        self.color = color
+        Thing.__init__(self, position, color)    # position is [y,x]
 
         self.direction = [0,0]
-        self.size = [0,0]
-        self.picture = ['']
 
         # self.draw()
 
-    # Get the picture of the object in question, and assign LEFT or RIGHT picture
+    # which image the object has (some choose between a few)
+    def spriteState(self):
+        return self.image.__name__
+
+    # Get the picture of the object in question
     def getPicture(self):
-        self.picture = self.image()
-        # Get size of the object's picture
-        self.size = [ len(self.picture), len(self.picture[0]) ]
+        self.sprite = get_sprite(self, 'image')
+        # Get picture and size of the object's sprite
+        self.picture = self.sprite.picture
+        self.size = self.sprite.size
 
 # Surfaces (for sea and sand)
 class Surface(object):
@@ -1046,37 +1926,43 @@ class Surface(object):
 
     #draw line (override NonMovingThing .draw() method
     def draw(self):
+        glyph = glyphs(self.color)
         #draw line
         x = 1
         y = int(self.position)
         while x < (WIDTH - 1):
-            Aquarium.stage[y][x] = colored( '~', self.color)
+            Aquarium.stage[y][x] = glyph['~']
             x += 1
+        Aquarium.touch(y, 1, WIDTH - 1)
 
     #draw fill under line
     def drawUnder(self):
+        glyph = glyphs(self.color)
         #draw under line
         x = 1
         y = int(self.position + 1)
         while y < (HEIGHT - 1):
             while x < (WIDTH - 2):
-                Aquarium.stage[y][x] = colored( ',', self.color)
+                Aquarium.stage[y][x] = glyph[',']
                 x += (HEIGHT - self.position) // (y - self.position)  #1
                 #Aquarium.stage[y][x] = ' '
                 x += 1   #1
             #x = (y % 2) + 1
+            Aquarium.touch(y, 1, WIDTH - 1)
             x = randint(1, 3)
             y += 1
 
     #draw fill above line
     def drawAbove(self):
+        glyph = glyphs(self.color)
         #draw under line
         x = 1
         y = 1
         while y < (self.position):
             while x < (WIDTH - 1):
-                Aquarium.stage[y][x] = colored( '-', self.color)
+                Aquarium.stage[y][x] = glyph['-']
                 x += 6
+            Aquarium.touch(y, 1, WIDTH - 1)
             x = 3*(y % 2) + 1
             y += 1
 
@@ -1084,21 +1970,30 @@ class Surface(object):
 
 # Dune Class
 class Dune(NonMovingThing):
+    __slots__ = ()
+
+    # edges of dune drawing should be ommitted
+    transparent = 'R'
+
     # Draw the object, but omit the blank areas on the sides (which would create a blank box)
     def draw(self):
         self.getPicture()
-        for y in range( self.size[0] ):
-            for x in range( self.size[1] ):
-                if  y + self.position[0] > 1 and \
-                    y + self.position[0] < (HEIGHT-1) and \
-                    x + self.position[1] > 1 and \
-                    x + self.position[1] < (WIDTH-1) :
-                    if self.picture[y][x] != 'R':        # edges of dune drawing should be ommitted
-                        Aquarium.stage[ y + self.position[0] ][ x + self.position[1] ] \
-                        = colored(self.picture[y][x], self.color)
+        top  = self.position[0]
+        left = self.position[1]
+        blit(Aquarium.stage, self.sprite, self.color, top, left, (2, HEIGHT-1, 2, WIDTH-1))
+        Aquarium.touchSprite(self.sprite, top, left)
+
+    def drawnCells(self):
+        self.getPicture()
+        top  = self.position[0]
+        left = self.position[1]
+        return [ (y + top, x + left) for y, x, char in self.sprite.cells
+                 if 1 < y + top < (HEIGHT-1) and 1 < x + left < (WIDTH-1) ]
 
 # Dunes
 class SmallDune(Dune):
+    __slots__ = ()
+
     def image(self):
         return (                            
         'RRR.~""~.RRR',
@@ -1107,6 +2002,8 @@ class SmallDune(Dune):
         )
 
 class BigDune(Dune):
+    __slots__ = ()
+
     def image(self):
         return (                            
         'RRRRRRR,.~"""""~. ,RRRRRR',
@@ -1116,6 +2013,8 @@ class BigDune(Dune):
         )
 
 class HugeDune(Dune):
+    __slots__ = ()
+
     def image(self):
         return (                            
         'RRRRRR,.~"""""""~. ,RRRRRR',
@@ -1127,6 +2026,8 @@ class HugeDune(Dune):
         )
 
 class SlopedDune(Dune):
+    __slots__ = ()
+
     def image(self):
         return (                            
         'RRRRRRRR,.~"""""""~.,RRRRRRRRRRRRRRRRRRRRRRRRR',
@@ -1140,6 +2041,8 @@ class SlopedDune(Dune):
         )
 
 class SlantedDune(Dune):
+    __slots__ = ()
+
     def image(self):
         return (                            
         'RRRRRRRRRRRRRR,.~"""""""~.,RRRRRRRRRRRRRRRRRR',
@@ -1155,6 +2058,10 @@ class SlantedDune(Dune):
 
 # Corals
 class TreeCoral(NonMovingThing):
+    # (chooses between a few images)
+    __slots__ = ('image',)
+    snapshot_fields = __slots__
+
     def __init__(self, position, color):
         NonMovingThing.__init__(self, position, color)
 
@@ -1182,6 +2089,8 @@ class TreeCoral(NonMovingThing):
         )
 
 class BrainCoral(NonMovingThing):
+    __slots__ = ()
+
     def image(self):
         return (
         '    ,#&.   ',
@@ -1190,6 +2099,8 @@ class BrainCoral(NonMovingThing):
         )
 
 class Kelp(NonMovingThing):
+    __slots__ = ()
+
     def image(self):
         return (
         ' V ',                
@@ -1208,6 +2119,8 @@ class Kelp(NonMovingThing):
         )
 
 class LongKelp(NonMovingThing):
+    __slots__ = ()
+
     def image(self):
         return (
         ' V ',                
@@ -1312,6 +2225,155 @@ class LongKelp(NonMovingThing):
         )
 
 
+# Uniform grid of buckets, for finding the nearest member of a group quickly
+class SpatialGrid(object):
+    """Index of a group of moving things, bucketed by position.
+
+    findNearest() gives the same answer as MovingThing.findNearest() does for
+    the list (same distance metric, with dy halved, and ties going to whoever
+    is first in the group), but only looks at the buckets within the search
+    radius instead of the whole group.  Members tell the grid when they move
+    (see MovingThing.reindex).  Buckets are sets, so moving from one to
+    another is O(1) (the order within a bucket doesn't matter, since ties
+    go by order).
+    """
+    # (cells are twice as tall as they are wide, since dy is halved)
+    cell_width  = 4
+    cell_height = 8
+    # findNearest() only counts things with a squared distance under this
+    radius_sq = 500
+    # (small groups are quicker to just check one by one)
+    small_group = 24
+    # offsets of the cells in each square ring around a cell
+    rings = []
+
+    def __init__(self, group=()):
+        self.buckets = {}           # (cell_y, cell_x) -> set of members
+        self.cell    = {}           # member -> (cell_y, cell_x)
+        self.order   = {}           # member -> position in group (for ties)
+        self.count   = 0
+        self.changes = 0            # times members have been added or removed
+        self.max_width = 0
+        self.columns = None         # what span() found (until a member changes cell)
+        for member in group:
+            self.add(member)
+
+    def cellOf(self, member):
+        return ( int(member.position[0]) // self.cell_height,
+                 int(member.position[1]) // self.cell_width )
+
+    def add(self, member):
+        self.order[member] = self.count
+        self.count += 1
+        member.grids = member.grids + (self,)
+        self.cell[member] = self.cellOf(member)
+        self.buckets.setdefault(self.cell[member], set()).add(member)
+        self.max_width = max(self.max_width, member.size[1])
+        self.columns = None
+        self.changes += 1
+
+    def remove(self, member):
+        self.buckets[ self.cell.pop(member) ].remove(member)
+        del self.order[member]
+        member.grids = tuple(grid for grid in member.grids if grid is not self)
+        self.columns = None
+        self.changes += 1
+
+    def update(self, member):
+        if member.size[1] > self.max_width:
+            self.max_width = member.size[1]
+            self.columns = None
+        cell = self.cellOf(member)
+        if cell != self.cell[member]:
+            self.buckets[ self.cell[member] ].remove(member)
+            self.buckets.setdefault(cell, set()).add(member)
+            self.cell[member] = cell
+            self.columns = None
+
+    # Offsets of the cells that are [k] cells away (a square ring)
+    @staticmethod
+    def ring(k):
+        while len(SpatialGrid.rings) <= k:
+            n = len(SpatialGrid.rings)
+            SpatialGrid.rings.append( [ (dy, dx) for dy in range(-n, n+1)
+                                                 for dx in range(-n, n+1)
+                                                 if max(abs(dy), abs(dx)) == n ] )
+        return SpatialGrid.rings[k]
+
+    # Smallest squared distance anything [k] rings away could be at
+    def ringDistance(self, k):
+        if k < 2:
+            return 0
+        dx = max( 0, (k-1)*self.cell_width - self.max_width )
+        dy = ( (k-1)*self.cell_height ) // 2
+        return min(dx, dy)**2
+
+    # Columns the members are somewhere between (left, right), by their cells
+    # (None when there aren't any)
+    def span(self):
+        if self.columns is None:
+            cells = [ cell_x for (cell_y, cell_x), members in self.buckets.items() if members ]
+            self.columns = ( min(cells) * self.cell_width,
+                             (max(cells) + 1) * self.cell_width + self.max_width ) if cells else ()
+        return self.columns or None
+
+    def __len__(self):
+        return len(self.order)
+
+    # Members, in the order they were added
+    def members(self):
+        return sorted(self.order, key=self.order.get)
+
+    def findNearest(self, seeker, side='tail'):
+        front = side.lower() in ['front', 'mouth']
+        y = int(seeker.position[0])
+        x = int(seeker.position[1])
+        cell_y = y // self.cell_height
+        cell_x = x // self.cell_width
+
+        nearest_member = FarawayObject
+        nearest_dr     = self.radius_sq
+        nearest_order  = -1
+
+        # (nothing can be near enough when the seeker is well away from them all)
+        span = self.span()
+        if span is None or max(span[0] - x, x - span[1], 0)**2 >= self.radius_sq:
+            return nearest_member
+
+        # look in rings of cells around the seeker, until the next ring is
+        # too far away to have anything nearer than what was found already
+        # (or, for a small group, just look at everyone)
+        small = len(self.order) <= self.small_group
+        k = 0
+        while True:
+            ring_dr = self.ringDistance(k)
+            if ring_dr >= self.radius_sq or ring_dr > nearest_dr or (small and k > 0):
+                break
+            if small:
+                groups = [self.order]
+            else:
+                groups = [ self.buckets.get((cell_y + dy, cell_x + dx), ())
+                           for dy, dx in self.ring(k) ]
+            for group in groups:
+                for member in group:
+                    if member is seeker:
+                        continue
+                    # (same as MovingThing.getDistance)
+                    if (member.direction[1] < 0) != front:
+                        dx_member = member.position[1] + member.size[1] - x
+                    else:
+                        dx_member = member.position[1] - x
+                    dr = dx_member**2 + ((member.position[0] - y)//2)**2
+                    if dr == 0:
+                        continue
+                    if dr < nearest_dr or \
+                       (dr == nearest_dr and self.order[member] < nearest_order):
+                        nearest_member = member
+                        nearest_dr     = dr
+                        nearest_order  = self.order[member]
+            k += 1
+        return nearest_member
+
 # School class
 class School(object):
     def __init__(self, students, LeadType, FollowType, FollowDistance):
@@ -1320,8 +2382,28 @@ class School(object):
         self.FollowType     = FollowType
         self.FollowDistance = FollowDistance
 
+        # index of the students (for finding the nearest one)
+        self.grid = SpatialGrid(self.students)
+
+        # move all the students at once with numpy (if set)
+        self.engine = SwarmEngine(self) if swarm_engine else None
+
         self.createFollowingOrder()
 
+    # Move the school for this loop
+    def step(self):
+        # (far off the screen, the whole school just coasts along now and then)
+        steps = detail.schoolSteps(self)
+        if steps != 1:
+            if steps:
+                for student in self.students:
+                    student.coast(steps)
+            return
+        if self.engine is not None:
+            self.engine.automate()
+        else:
+            self.automate()
+
     # Direct which kind of LeadType
     def Lead(self, current_student):
         if str(self.LeadType).lower() == "randomMove".lower():
@@ -1343,6 +2425,9 @@ class School(object):
             current_leader  = self.following_order[student]
             distance        = self.FollowDistance
 
+            if detail.coast(current_student):
+                continue
+
             if current_leader == '0':
                 self.Lead(current_student)
             else:
@@ -1355,13 +2440,21 @@ class School(object):
 
     # Everyone flees something
     def everyoneFlee(self, enemy_list, distance):
+        if self.engine is not None:
+            return self.engine.everyoneFlee(enemy_list, distance)
         for student in self.students:
+            if detail.skip(student):
+                continue
             enemy = student.findNearest(enemy_list)
             student.flee(enemy, distance)
 
     # Everyone hunts something
     def everyoneHunt(self, target_list, distance):
+        if self.engine is not None:
+            return self.engine.everyoneHunt(target_list, distance)
         for student in self.students:
+            if detail.skip(student):
+                continue
             target = student.findNearest(target_list)
             student.follow(target, distance)
 
@@ -1473,8 +2566,10 @@ class Neighbor(School):
         self.following_order = []
     def automate(self):
         for student in self.students:
+            if detail.coast(student):
+                continue
             # each fish follows nearest fish in school
-            self.Follow( student, student.findNearest(self.students), self.FollowDistance )
+            self.Follow( student, student.findNearest(self.grid), self.FollowDistance )
 
 # Same as Neighbor, but keep personal space
 class ShyNeighbor(Neighbor):
@@ -1492,21 +2587,877 @@ class ShyNeighbor(Neighbor):
     def automate(self):
         Neighbor.automate(self)
         for student in self.students:
-            nearest = student.findNearest(self.students)
+            if detail.skip(student):
+                continue
+            nearest = student.findNearest(self.grid)
             if student.getDistance(nearest)[3] <= self.FollowDistance:
                 #student.flee( student.findNearest(self.students), 1 )
                 student.flee( nearest, self.FollowDistance - 1 )
 
+#------------------------------- SWARM ENGINE ----------------------------------
+
+# Moves a whole school at once with numpy arrays, instead of fish by fish
+class SwarmEngine(object):
+    """Struct-of-arrays version of a School's behaviors.
+
+    The students' positions, directions and speeds are read from their
+    columns in the entity store (along with the size of their sprites), all
+    of them are advanced with the same rules as MovingThing (follow,
+    randomMove, calmRandomMove, flee, turn_around_water), and the results go
+    back into the columns and onto the students that changed (for the rest
+    of the aquarium).  Leaders are taken from where everyone was at the
+    start of the step, instead of fish by fish.
+    """
+    # the rest of the aquarium only sees students whose squared distance is
+    # under this (same as findNearest)
+    radius_sq = 500
+    # (targets are bucketed into cells like SpatialGrid's, but smaller, since
+    # a whole school is packed in much more tightly than the aquarium)
+    cell_width  = 2
+    cell_height = 4
+
+    def __init__(self, school):
+        self.school = school
+        # (the entity store's version when the students' rows were found)
+        self.version = None
+        # rows of the members of the grids it has looked at (see locate)
+        self.located = {}
+
+    #-------------------------------- arrays -----------------------------------
+    # Gather a group of things into arrays
+    def gather(self, group):
+        return ( np.array([thing.position[0]  for thing in group], dtype=int),
+                 np.array([thing.position[1]  for thing in group], dtype=int),
+                 np.array([thing.direction[0] for thing in group], dtype=int),
+                 np.array([thing.direction[1] for thing in group], dtype=int),
+                 np.array([thing.size[0]      for thing in group], dtype=int),
+                 np.array([thing.size[1]      for thing in group], dtype=int) )
+
+    # Find the students' rows in the entity store (putting them in it, if they
+    # aren't yet), and what doesn't change as they move (again only when
+    # things have come or gone)
+    def findRows(self):
+        students = self.school.students
+        if self.version == (ecosystem.version, len(students)):
+            return
+        rows = ecosystem.rows
+        self.rows     = np.array([ rows[ecosystem.add(s) ] for s in students ], dtype=int)
+        self.maxspeed = np.array([ s.maxspeed for s in students ], dtype=int)
+        self.entity   = np.array([ s.entity   for s in students ], dtype=int)
+        self.version  = (ecosystem.version, len(students))
+        self.leading  = None
+
+    # Read the students' columns (everything the rules change or read)
+    def load(self):
+        self.findRows()
+        ecosystem.refresh()
+        rows = self.rows
+        numbers = ecosystem.numbers
+        self.y     = numbers('y')[rows].astype(int)
+        self.x     = numbers('x')[rows].astype(int)
+        self.dy    = numbers('dy')[rows].astype(int)
+        self.dx    = numbers('dx')[rows].astype(int)
+        self.speed = numbers('speed')[rows].astype(int)
+        self.h, self.w = sprite_sizes()[ numbers('sprite')[rows] ].T
+        # (to tell which students store has to write back)
+        self.loaded = (self.y.copy(), self.x.copy(), self.dy.copy(), self.dx.copy(),
+                       self.speed.copy())
+
+    # How many loops each student moves this loop (see DetailController.steps)
+    def steps(self):
+        return detail.stepsArray(self.y, self.x, self.h, self.w, self.entity)
+
+    # Write the columns back, and the students that changed (letting the
+    # spatial grids know about the ones that moved to another cell)
+    def store(self):
+        rows = self.rows
+        numbers = ecosystem.numbers
+        numbers('y')[rows]     = self.y
+        numbers('x')[rows]     = self.x
+        numbers('dy')[rows]    = self.dy
+        numbers('dx')[rows]    = self.dx
+        numbers('speed')[rows] = self.speed
+
+        y, x, dy, dx, speed = self.loaded
+        moved = ( (self.y // SpatialGrid.cell_height != y // SpatialGrid.cell_height) |
+                  (self.x // SpatialGrid.cell_width  != x // SpatialGrid.cell_width) )
+        changed = (self.y != y) | (self.x != x) | \
+                  (self.dy != dy) | (self.dx != dx) | (self.speed != speed)
+        index = np.flatnonzero(changed)
+        students = self.school.students
+        changes = zip( index.tolist(), moved[index].tolist(),
+                       self.y[index].tolist(), self.x[index].tolist(),
+                       self.dy[index].tolist(), self.dx[index].tolist(),
+                       self.speed[index].tolist() )
+        for i, new_cell, y, x, dy, dx, speed in changes:
+            student = students[i]
+            student.position[0] = y
+            student.position[1] = x
+            student.direction[0] = dy
+            student.direction[1] = dx
+            student.speed = speed
+            # (its row is up to date already, see MovingThing.reindex)
+            if new_cell:
+                for grid in student.grids:
+                    grid.update(student)
+
+    # Where a list or SpatialGrid of things are, like gather():  a grid's
+    # members (in order, see SpatialGrid.members) are read from their columns
+    def locate(self, group):
+        if not isinstance(group, SpatialGrid):
+            return self.gather(group)
+        key = (ecosystem.version, group.changes)
+        if self.located.get(group, (None,))[0] != key:
+            rows = ecosystem.rows
+            self.located[group] = (key, np.array([ rows[ecosystem.add(member)]
+                                                   for member in group.members() ], dtype=int))
+        rows = self.located[group][1]
+        numbers = ecosystem.numbers
+        sizes = sprite_sizes()[ numbers('sprite')[rows] ]
+        return ( numbers('y')[rows].astype(int), numbers('x')[rows].astype(int),
+                 numbers('dy')[rows].astype(int), numbers('dx')[rows].astype(int),
+                 sizes[:,0], sizes[:,1] )
+
+    #------------------------------- distances ---------------------------------
+    # x of the tail (or mouth) of each thing (same as MovingThing.getDistance)
+    def edge(self, x, w, dx, front=False):
+        if front:
+            return np.where(dx < 0, x, x + w)
+        return np.where(dx < 0, x + w, x)
+
+    # Index of the nearest target for each student (-1 for FarawayObject)
+    # (targets are sorted by cell, then each student looks at the cells in
+    # rings around its own, like SpatialGrid.findNearest, until the next ring
+    # is too far away to have anything nearer)
+    def nearest(self, ty, tedge, same_group=False):
+        n = len(self.y)
+        count = len(ty)
+        nearest = np.full(n, -1, dtype=int)
+        if count == 0:
+            return nearest
+
+        # cells of the targets (as numbers, rows of cells one after another),
+        # and the targets sorted by them (in order within each cell, for ties)
+        cell_y = ty // self.cell_height
+        cell_x = tedge // self.cell_width
+        top, left = cell_y.min() - 1, cell_x.min() - 1
+        rows = cell_y.max() + 2 - top
+        columns = cell_x.max() + 2 - left
+        cells = (cell_y - top) * columns + (cell_x - left)
+        order = np.argsort(cells, kind='mergesort')
+        cells = cells[order]
+
+        # (squared distance, then index:  the smallest one is the nearest)
+        none = self.radius_sq * count
+        best = np.full(n, none, dtype=np.int64)
+        seeker_y = self.y // self.cell_height - top
+        seeker_x = self.x // self.cell_width - left
+        seekers = np.arange(n)
+        k = 0
+        while len(seekers):
+            ring = np.array(SpatialGrid.ring(k))
+            # every seeker with every cell of the ring (that has any targets)
+            who = np.repeat(seekers, len(ring))
+            at_y = seeker_y[who] + np.tile(ring[:,0], len(seekers))
+            at_x = seeker_x[who] + np.tile(ring[:,1], len(seekers))
+            inside = (at_y >= 0) & (at_y < rows) & (at_x >= 0) & (at_x < columns)
+            who, cell = who[inside], (at_y * columns + at_x)[inside]
+            start = np.searchsorted(cells, cell, 'left')
+            found = np.searchsorted(cells, cell, 'right') - start
+            # every seeker with every target in those cells
+            who = np.repeat(who, found)
+            first = np.cumsum(found) - found
+            target = order[ np.repeat(start - first, found) + np.arange(len(who)) ]
+
+            dy = ty[target] - self.y[who]
+            dx = tedge[target] - self.x[who]
+            dr = dx**2 + (dy//2)**2
+            # ignore self, and those at the same position
+            near = (dr > 0) & (dr < self.radius_sq)
+            if same_group:
+                near &= target != who
+            np.minimum.at(best, who[near], (dr * count + target)[near])
+
+            # (keep looking while the next ring could have something nearer)
+            k += 1
+            reach = self.ringDistance(k)
+            if reach >= self.radius_sq:
+                break
+            seekers = seekers[ best[seekers] >= reach * count ]
+
+        found = best < none
+        nearest[found] = best[found] % count
+        return nearest
+
+    # Smallest squared distance anything [k] rings of cells away could be at
+    def ringDistance(self, k):
+        if k < 2:
+            return 0
+        dx = (k-1)*self.cell_width
+        dy = ( (k-1)*self.cell_height ) // 2
+        return min(dx, dy)**2
+
+    # Position of each student's target (FarawayObject where index is -1)
+    def targets(self, index, ty, tedge):
+        faraway = index < 0
+        if len(ty) == 0:
+            ty = tedge = np.zeros(1, dtype=int)
+        return ( np.where(faraway, FarawayObject.position[0], ty[index]),
+                 np.where(faraway, FarawayObject.position[1], tedge[index]) )
+
+    #--------------------------------- rules -----------------------------------
+    # Keep speed from exploding (same as speed_check_before)
+    def speedCheck(self, mask):
+        self.speed[mask] = np.clip(self.speed, 0, self.maxspeed)[mask]
+
+    # Turn around at the walls, then move (same as turn_around_water + move)
+    def move(self, mask):
+        left_wall   = 1 - MARGIN_WATER
+        right_wall  = WORLD_WIDTH + MARGIN_WATER
+        top_wall    = Water.position + 1
+        bottom_wall = HEIGHT - 1
+        speed = self.speed
+        self.dx[mask & (self.x < speed + left_wall)] = 1
+        self.dx[mask & (self.x > right_wall - (self.dx*speed + self.w + 1))] = -1
+        self.dy[mask & (self.y < speed + top_wall)] = 1
+        self.dy[mask & (self.y > bottom_wall - (self.dy*speed + self.h + 1))] = -1
+        self.y[mask] += (self.dy*speed)[mask]
+        self.x[mask] += (self.dx*speed)[mask]
+
+    # Make up for [steps] loops at once (same as MovingThing.coast)
+    def coast(self, mask, steps):
+        speed = self.speed
+        self.speed = speed * np.where(mask, steps, 1)
+        self.move(mask)
+        self.speed = speed
+
+    def randomMove(self, mask):
+        self.speedCheck(mask)
+        n = len(mask)
+        change = mask & (swarm_random.randint(1, 7, n) == 1)
+        self.dy[change] += swarm_random.randint(-1, 2, n)[change]
+        self.dx[change] += swarm_random.randint(-2, 3, n)[change]
+        self.speed[change] += swarm_random.randint(-1, 2, n)[change]
+        self.dy[mask & (abs(self.dy) > 1)] = 0
+        self.dx[mask] = np.where(abs(self.dx) > 1, np.sign(self.dx), self.dx)[mask]
+        self.move(mask)
+
+    def calmRandomMove(self, mask, y_rand=4, stop_rand=50, resume_rand=8, turn_rand=500):
+        self.speedCheck(mask)
+        n = len(mask)
+        change = mask & (swarm_random.randint(1, y_rand+1, n) == 1)
+        self.dy[change] += swarm_random.randint(-1, 2, n)[change]
+        self.dy[mask & (abs(self.dy) > 1)] = 0
+        if turn_rand:
+            self.dx[mask & (swarm_random.randint(1, turn_rand+1, n) == 1)] *= -1
+        if stop_rand:
+            self.dx[mask & (swarm_random.randint(1, stop_rand+1, n) == 1)] = 0
+            resume = mask & (self.dx == 0) & (swarm_random.randint(1, resume_rand+1, n) == 1)
+            self.dx[resume] = swarm_random.randint(-1, 2, n)[resume]
+        self.move(mask)
+
+    # Head back towards a target (y, tail) when further away than distance
+    def follow(self, mask, ty, ttail, distance):
+        self.speedCheck(mask)
+        dy = ty - self.y
+        dx = ttail - self.x
+        far = mask & ( (dx**2 + (dy//2)**2) >= distance**2 )
+        self.dy[far & (dy != 0)] = np.sign(dy)[far & (dy != 0)]
+        self.dx[far & (dx != 0)] = np.sign(dx)[far & (dx != 0)]
+        self.speed[far] += 1
+
+    # Swim away from an enemy (y, mouth) when within distance
+    def flee(self, mask, ty, tfront, distance):
+        self.speedCheck(mask)
+        dy = ty - self.y
+        dx = tfront - self.x
+        fleeing = mask & ( (dx**2 + (dy//2)**2) <= distance**2 )
+        self.dy[fleeing & (dy != 0)] = -np.sign(dy)[fleeing & (dy != 0)]
+        self.dx[fleeing & (dx != 0)] = -np.sign(dx)[fleeing & (dx != 0)]
+        for _ in range(3):
+            self.move(fleeing)
+
+    #-------------------------------- schools ----------------------------------
+    # Who each student follows, and whether they lead instead (worked out
+    # once, unless it's whoever is nearest)
+    def leaders(self):
+        school = self.school
+        n = len(school.students)
+        if isinstance(school, Neighbor):
+            # nearest schoolmate (by tail), from where everyone is now
+            tails = self.edge(self.x, self.w, self.dx)
+            return np.zeros(n, dtype=bool), self.nearest(self.y, tails, same_group=True)
+
+        if self.leading is None:
+            index = dict( (id(student), i) for i, student in enumerate(school.students) )
+            leads  = np.zeros(n, dtype=bool)
+            leader = np.full(n, -1, dtype=int)
+            for i in range(n):
+                if school.following_order[i] == '0':
+                    leads[i] = True
+                else:
+                    leader[i] = index[ id(school.following_order[i]) ]
+            self.leading = (leads, leader)
+        leads, leader = self.leading
+        return leads.copy(), leader
+
+    # Move the whole school for this loop (same as School.automate)
+    def automate(self):
+        school = self.school
+        if len(school.students) == 0:
+            return
+        self.load()
+        leads, leader = self.leaders()
+        follows = ~leads
+        # (off-screen students may sit this loop out, or coast along)
+        steps = self.steps()
+        skip = steps != 1
+        leads &= ~skip
+        follows &= ~skip
+        self.coast(steps > 1, steps)
+
+        # followers head back towards their leader
+        if school.FollowType in ["randomFollow", "calmRandomFollow"]:
+            tails = self.edge(self.x, self.w, self.dx)
+            self.follow( follows, *self.targets(leader, self.y, tails),
+                         distance=school.FollowDistance )
+        else:
+            follows[:] = False
+
+        # then everyone moves on their own
+        calm = np.zeros(len(leads), dtype=bool)
+        wild = np.zeros(len(leads), dtype=bool)
+        if str(school.LeadType).lower() == "calmRandomMove".lower():
+            calm |= leads
+        elif str(school.LeadType).lower() == "randomMove".lower():
+            wild |= leads
+        if school.FollowType == "calmRandomFollow":
+            calm |= follows
+        elif school.FollowType == "randomFollow":
+            wild |= follows
+        self.randomMove(wild)
+        self.calmRandomMove(calm)
+
+        # shy neighbors back away from the nearest one, if they're too close
+        if isinstance(school, ShyNeighbor):
+            tails = self.edge(self.x, self.w, self.dx)
+            nearest = self.nearest(self.y, tails, same_group=True)
+            ny, ntail = self.targets(nearest, self.y, tails)
+            too_close = ~skip & \
+                        ( ((ntail - self.x)**2 + ((ny - self.y)//2)**2) <= school.FollowDistance )
+            fronts = self.edge(self.x, self.w, self.dx, front=True)
+            self.flee( too_close, *self.targets(nearest, self.y, fronts),
+                       distance=school.FollowDistance - 1 )
+        self.store()
+
+    # Everyone flees the nearest enemy (same as School.everyoneFlee)
+    def everyoneFlee(self, enemy_list, distance):
+        if len(self.school.students) == 0 or len(enemy_list) == 0:
+            return
+        self.load()
+        ey, ex, edy, edx, eh, ew = self.locate(enemy_list)
+        nearest = self.nearest(ey, self.edge(ex, ew, edx))
+        self.flee( self.steps() == 1,
+                   *self.targets(nearest, ey, self.edge(ex, ew, edx, front=True)),
+                   distance=distance )
+        self.store()
+
+    # Everyone hunts the nearest target (same as School.everyoneHunt)
+    def everyoneHunt(self, target_list, distance):
+        if len(self.school.students) == 0:
+            return
+        self.load()
+        ty, tx, tdy, tdx, th, tw = self.locate(target_list)
+        tails = self.edge(tx, tw, tdx)
+        nearest = self.nearest(ty, tails)
+        self.follow( self.steps() == 1,
+                     *self.targets(nearest, ty, tails), distance=distance )
+        self.store()
+
+#------------------------------- FRAME PACING ----------------------------------
+
+# Sleeps until each frame is due (instead of busy-waiting)
+class FramePacer(object):
+    """Frame deadlines on the monotonic clock, with a fixed simulation step.
+
+    Frames are due every frame_time seconds, and the simulation moves in
+    fixed steps of step_time, however long each frame takes.  If the
+    simulation falls behind, 'catch-up' runs the missed steps (up to
+    max_catch_up in a frame) and 'skip' drops them.
+    """
+    def __init__(self, frame_time, step_time, policy='catch-up', max_catch_up=5):
+        self.frame_time   = frame_time
+        self.step_time    = step_time
+        self.policy       = policy
+        self.max_catch_up = max_catch_up
+
+        now = monotonic()
+        self.next_frame  = now      # when the next frame should start
+        self.next_step   = now      # when the next simulation step is due
+        self.frame_start = now
+
+        self.work       = 0.0       # time the last frame took (without sleeping)
+        self.jitter     = 0.0       # how late the last frame started
+        self.max_jitter = 0.0
+        self.overruns   = 0         # frames that took longer than frame_time
+        self.skipped    = 0         # simulation steps that were dropped
+
+    # Start a frame, and get how many simulation steps are due
+    def beginFrame(self):
+        now = self.frame_start = monotonic()
+        # (how late this frame started)
+        self.jitter = max(0.0, now - self.next_frame)
+        self.max_jitter = max(self.max_jitter, self.jitter)
+        if now < self.next_step:
+            return 0
+        due = int( (now - self.next_step) // self.step_time ) + 1
+
+        if self.policy == 'skip':
+            limit = 1
+        else:
+            limit = self.max_catch_up
+        if due > limit:
+            # too far behind:  drop the rest, and start counting from now
+            self.skipped += due - limit
+            self.next_step = now + self.step_time
+            return limit
+        self.next_step += due * self.step_time
+        return due
+
+    # Time spent on this frame so far
+    def workTime(self):
+        return monotonic() - self.frame_start
+
+    # Finish a frame, and get how long until the next one is due
+    def finishFrame(self):
+        now = monotonic()
+        self.work = now - self.frame_start
+        self.next_frame += self.frame_time
+        if now > self.next_frame:
+            # (start the next frame right away, rather than rushing to catch up)
+            self.overruns += 1
+            self.next_frame = now
+        return self.next_frame - now
+
+    # Finish a frame, and sleep until the next one is due
+    def endFrame(self):
+        sleep( self.finishFrame() )
+
+    # Start counting again from now (after being paused)
+    def restart(self):
+        now = monotonic()
+        self.next_frame = now
+        self.next_step  = now
+
+#--------------------------------- PROFILING -----------------------------------
+
+# Timings of each part of the loop, kept for the last few hundred runs
+class PhaseProfiler(object):
+    """Per-phase timings in fixed-size ring buffers.
+
+    measure() runs a function and keeps how long it took, under a name
+    (the oldest timing is overwritten once there are `samples` of them).
+    Percentiles come from whatever is in the buffer, so they follow
+    recent frames rather than the whole run.
+    """
+    def __init__(self, names, samples=256):
+        self.names   = list(names)
+        self.samples = samples
+        self.buffers = {}           # name -> ring buffer of times (seconds)
+        self.next    = {}           # name -> where the next time goes
+        self.count   = {}           # name -> timings so far
+        self.total   = {}           # name -> all the time so far
+        for name in self.names:
+            self.addName(name)
+
+    def addName(self, name):
+        if name not in self.names:
+            self.names.append(name)
+        self.buffers[name] = [0.0] * self.samples
+        self.next[name]    = 0
+        self.count[name]   = 0
+        self.total[name]   = 0.0
+
+    # Run a function, and keep how long it took
+    def measure(self, name, function):
+        t_start = monotonic()
+        function()
+        self.add( name, monotonic() - t_start )
+
+    def add(self, name, seconds):
+        if name not in self.buffers:
+            self.addName(name)
+        i = self.next[name]
+        self.buffers[name][i] = seconds
+        self.next[name]   = (i + 1) % self.samples
+        self.count[name] += 1
+        self.total[name] += seconds
+
+    # Timings still in the ring buffer
+    def recent(self, name):
+        return self.buffers[name][ : min(self.count[name], self.samples) ]
+
+    # (nearest-rank percentiles, of the recent timings)
+    def percentiles(self, name, ranks):
+        times = sorted( self.recent(name) )
+        if not times:
+            return [0.0 for rank in ranks]
+        return [ times[ min(len(times) - 1, (len(times) * rank) // 100) ] for rank in ranks ]
+
+    # Everything as a dict (in milliseconds)
+    def report(self):
+        report = {}
+        for name in self.names:
+            p50, p95, p99 = self.percentiles(name, (50, 95, 99))
+            report[name] = {
+                'p50'   : 1000 * p50,
+                'p95'   : 1000 * p95,
+                'p99'   : 1000 * p99,
+                'mean'  : 1000 * self.total[name] / max(self.count[name], 1),
+                'count' : self.count[name],
+            }
+        return report
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+#------------------------------ LEVEL OF DETAIL --------------------------------
+
+# Sheds work in small, reversible steps when frames run long
+class DetailController(object):
+    """Feedback controller for the level of detail.
+
+    The work time of each frame is smoothed, and compared to the budget.
+    While it stays over budget, the level goes up one step at a time (each
+    level saves a bit more work than the last); while there is plenty of
+    room under the budget, the level comes back down, until the aquarium is
+    back to full detail.  Nothing is removed from the aquarium.
+    """
+    levels = [
+        # max_bubbles,  freeze_jellyfish,  school_stagger,  offscreen_every
+        ( None,         False,             1,               1 ),    # full detail
+        ( 8,            False,             1,               1 ),
+        ( 8,            True,              1,               1 ),
+        ( 8,            True,              2,               1 ),
+        ( 8,            True,              2,               4 ),
+        ( 3,            True,              3,               8 ),
+    ]
+    # (smoothing of the frame times, and how long to wait before changing)
+    smoothing       = 0.2
+    shed_after      = 3         # frames over budget
+    restore_after   = 50        # frames with room to spare
+    headroom        = 0.6       # "room to spare" is under this much of the budget
+
+    def __init__(self, budget):
+        self.budget  = budget
+        self.average = 0.0
+        self.over    = 0
+        self.under   = 0
+        self.setLevel(0)
+
+    def setLevel(self, level):
+        self.level = level
+        self.max_bubbles, self.freeze_jellyfish, \
+            self.school_stagger, self.offscreen_every = self.levels[level]
+        # (a replay has to change detail at the same time)
+        if recording is not None:
+            recording['detail'].append([tick, level])
+
+    # What the current level leaves out
+    def describe(self):
+        shed = []
+        if self.max_bubbles is not None:
+            shed.append("bubbles <= {}".format(self.max_bubbles))
+        if self.freeze_jellyfish:
+            shed.append("jellyfish frozen")
+        if self.school_stagger > 1:
+            shed.append("schools every {} loops".format(self.school_stagger))
+        if self.offscreen_every > 1:
+            shed.append("off-screen every {} loops".format(self.offscreen_every))
+        return "(" + ", ".join(shed) + ")" if shed else "(full detail)"
+
+    # Adjust the level after a frame took [work_time] seconds
+    def update(self, work_time):
+        self.average += (work_time - self.average) * self.smoothing
+        if self.average > self.budget:
+            self.over  += 1
+            self.under  = 0
+            if self.over >= self.shed_after and self.level < len(self.levels) - 1:
+                self.setLevel(self.level + 1)
+                self.over = 0
+        elif self.average < self.budget * self.headroom:
+            self.under += 1
+            self.over   = 0
+            if self.under >= self.restore_after and self.level > 0:
+                self.setLevel(self.level - 1)
+                self.under = 0
+        else:
+            self.over  = 0
+            self.under = 0
+
+    # How far a thing is off the screen, in columns or rows (0 when on it)
+    def distance(self, thing):
+        left = thing.position[1] - camera_x
+        top  = thing.position[0]
+        return max( 1 - (left + thing.size[1]), left - (WIDTH - 2),
+                    1 - (top + thing.size[0]), top - (HEIGHT - 2), 0 )
+
+    # How many loops a thing moves this loop:  1 on the screen, and off it
+    # either 0 (sitting this one out) or however many it has been sitting out
+    def steps(self, thing):
+        distance = self.distance(thing)
+        if distance == 0:
+            return 1
+        if not offscreen_lod:
+            return 1 if tick % self.offscreen_every == 0 else 0
+        every = max( self.offscreen_every,
+                     min(1 + distance // offscreen_blend, offscreen_slowest) )
+        if every == 1:
+            return 1
+        # (things take turns, rather than all moving in the same loop)
+        return every if (tick + (thing.entity or 0)) % every == 0 else 0
+
+    # Whether a thing sits out the rest of this loop (off the screen)
+    def skip(self, thing):
+        return self.steps(thing) != 1
+
+    # Same as skip(), but when it's the thing's turn it coasts along as far as
+    # it would have gone in the loops it sat out
+    def coast(self, thing):
+        steps = self.steps(thing)
+        if steps > 1:
+            thing.coast(steps)
+        return steps != 1
+
+    # Same as steps(), for arrays of positions, sizes and entity ids (for the
+    # swarm engine)
+    def stepsArray(self, y, x, h, w, entity):
+        left = x - camera_x
+        distance = np.maximum.reduce([ 1 - (left + w), left - (WIDTH - 2),
+                                       1 - (y + h), y - (HEIGHT - 2), np.zeros(len(y), dtype=int) ])
+        if not offscreen_lod:
+            steps = np.full(len(y), 1 if tick % self.offscreen_every == 0 else 0, dtype=int)
+        else:
+            every = np.maximum( self.offscreen_every,
+                                np.minimum(1 + distance // offscreen_blend, offscreen_slowest) )
+            steps = np.where( (tick + entity) % every == 0, every, 0 )
+            steps[every == 1] = 1
+        steps[distance == 0] = 1
+        return steps
+
+    # Whether a school sits out this loop's special behaviors (takes turns,
+    # and sits them out altogether when it's off the screen)
+    def staggered(self, school):
+        if self.school_stagger > 1 and \
+           (tick + schools.index(school)) % self.school_stagger != 0:
+            return True
+        return self.offscreen(school)
+
+    # Whether every one of a school sits out the rest of this loop
+    def offscreen(self, school):
+        # (going by the cells they're in first, which is quicker than going
+        #  through them all when they're far enough away)
+        if offscreen_lod and self.schoolDistance(school) >= offscreen_blend:
+            return True
+        return all( self.skip(student) for student in school.students )
+
+    # How far a school is off the screen at least, going by the cells its fish
+    # are in (0 when some of them might be on it)
+    def schoolDistance(self, school):
+        span = school.grid.span()
+        if span is None:
+            return 0
+        return max( span[0] - camera_x - (WIDTH - 2), 1 - (span[1] - camera_x), 0 )
+
+    # Same as steps(), for a whole school that's far off the screen (it's 1
+    # otherwise, and each of them goes by their own)
+    def schoolSteps(self, school):
+        if not offscreen_lod:
+            return 1
+        distance = self.schoolDistance(school)
+        if distance < offscreen_blend:
+            return 1
+        every = max( self.offscreen_every,
+                     min(1 + distance // offscreen_blend, offscreen_slowest) )
+        return every if (tick + (school.students[0].entity or 0)) % every == 0 else 0
+
+#-------------------------------- ENTITY STORE ---------------------------------
+
+# Keeps track of the creatures (and bubbles), and the groups they are in
+class EntityStore(object):
+    """Entities as integer ids, with their components in typed columns.
+
+    Each entity gets an id that stays the same for as long as it is in the
+    store, and a row in every column (species, color, school, sprite,
+    position, direction and speed).  The groups the loop goes through
+    ("swimmers", "fishies", "bubbles", "prey"...) are dense lists, each with
+    an index of where every member is in it, so adding or removing an entity
+    is O(1):  the last row (or member) takes the place of the one that was
+    removed.  Unions of groups are cached until one of the groups changes.
+
+    Things that move fish by fish say so when they do (see
+    MovingThing.reindex), and their rows are brought up to date by refresh()
+    before the columns are read.  The SwarmEngine moves its students in the
+    columns, and writes them back to the things.
+    """
+    columns = [ ('species', 'H'), ('color', 'H'), ('school', 'h'), ('sprite', 'I'),
+                ('y', 'i'), ('x', 'i'), ('dy', 'i'), ('dx', 'i'), ('speed', 'i') ]
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.things  = []       # row -> entity
+        self.rows    = {}       # id -> row
+        self.next_id = 0
+        self.version = 0        # times rows have been added or moved
+        self.column  = dict( (name, array(code)) for name, code in self.columns )
+        self.codes   = {}       # species and color names -> number (see name())
+        self.names   = []
+        self.moved   = set()    # things that moved since the last refresh()
+        self.groups  = {}       # group -> members
+        self.where   = {}       # group -> {id: index in members}
+        self.changes = {}       # group -> times its members have changed
+        self.views   = {}       # groups -> (changes when made, members)
+
+    # Number for a species or color name (and back again)
+    def code(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+    def name(self, code):
+        return self.names[code]
+
+    #------------------------------ entities -----------------------------------
+    # Give a thing an id and a row (unless it has them already), in a school
+    # (its number in schools) or not (-1)
+    def add(self, thing, school=-1):
+        if thing.entity is not None:
+            return thing.entity
+        thing.entity = self.next_id
+        self.next_id += 1
+        self.rows[thing.entity] = len(self.things)
+        self.things.append(thing)
+        column = self.column
+        column['species'].append( self.code(thing.__class__.__name__) )
+        column['color'].append( self.code(thing.color) )
+        column['school'].append(school)
+        for name in ['sprite', 'y', 'x', 'dy', 'dx', 'speed']:
+            column[name].append(0)
+        self.write(len(self.things) - 1, thing)
+        self.version += 1
+        return thing.entity
+
+    # Take a thing out of every group, and give up its row (the last row
+    # moves into it)
+    def remove(self, thing):
+        if thing.entity not in self.rows:
+            return
+        for group, where in self.where.items():
+            if thing.entity in where:
+                self.leave(group, thing)
+        row  = self.rows.pop(thing.entity)
+        last = self.things.pop()
+        if last is not thing:
+            self.things[row] = last
+            self.rows[last.entity] = row
+        for column in self.column.values():
+            value = column.pop()
+            if last is not thing:
+                column[row] = value
+        self.moved.discard(thing)
+        self.version += 1
+        thing.entity = None
+
+    # Copy where a thing is now (and which way it's going, how fast, and the
+    # picture it has) into its row
+    def write(self, row, thing):
+        column = self.column
+        column['sprite'][row] = thing.sprite.code
+        column['y'][row]      = int(thing.position[0])
+        column['x'][row]      = int(thing.position[1])
+        column['dy'][row]     = int(thing.direction[0])
+        column['dx'][row]     = int(thing.direction[1])
+        column['speed'][row]  = int(thing.speed)
+
+    # Bring the rows of the things that moved since the last time up to date
+    def refresh(self):
+        rows = self.rows
+        for thing in self.moved:
+            row = rows.get(thing.entity)
+            if row is not None:
+                self.write(row, thing)
+        self.moved.clear()
+
+    # A column as a numpy array (the same memory, so writing to it writes the
+    # column:  don't hold on to it, since the column can't grow while it's
+    # being looked at)
+    def numbers(self, name):
+        column = self.column[name]
+        return np.frombuffer(column, dtype=column.typecode)
+
+    #------------------------------- groups ------------------------------------
+    # The (live) list of members of a group, adding the given things to it
+    def group(self, group, things=()):
+        if group not in self.groups:
+            self.groups[group]  = []
+            self.where[group]   = {}
+            self.changes[group] = 0
+        for thing in things:
+            self.join(group, thing)
+        return self.groups[group]
+
+    def join(self, group, thing):
+        self.add(thing)
+        where = self.where[group]
+        if thing.entity in where:
+            return
+        members = self.groups[group]
+        where[thing.entity] = len(members)
+        members.append(thing)
+        self.changes[group] += 1
+
+    # (the last member takes its place)
+    def leave(self, group, thing):
+        members = self.groups[group]
+        index = self.where[group].pop(thing.entity)
+        last = members.pop()
+        if last is not thing:
+            members[index] = last
+            self.where[group][last.entity] = index
+        self.changes[group] += 1
+
+    # Members of any of the groups (once each), made again only after one of
+    # the groups has changed  (don't change the list that comes back)
+    def view(self, *groups):
+        changes = [ self.changes[group] for group in groups ]
+        cached = self.views.get(groups)
+        if cached is not None and cached[0] == changes:
+            return cached[1]
+        seen = set()
+        members = []
+        for group in groups:
+            for thing in self.groups[group]:
+                if thing.entity not in seen:
+                    seen.add(thing.entity)
+                    members.append(thing)
+        self.views[groups] = (changes, members)
+        return members
+
 #------------------------------ HELPER FUNCTIONS -------------------------------
 
 # randomly create bubbles to float up
 def create_bubbles():
     global bub
-    #randomly create bubbles
-    if bub % randint(1,bubble_frequency) == 2:
-        bub_position = [HEIGHT-5, randint(1, WIDTH -3)]
+    #randomly create bubbles (unless there are too many already)
+    if bub % randint(1,bubble_frequency) == 2 and \
+       (detail.max_bubbles is None or len(bub_list) < detail.max_bubbles):
+        bub_position = [HEIGHT-5, camera_x + randint(1, WIDTH -3)]
         bub_color    = choice(bubble_colors)
-        bub_list.append(Bubble(bub_position, bub_color))
+        ecosystem.join('bubbles', Bubble(bub_position, bub_color))
     bub += 1
 
 # group a school of fish around a random coral every now and then 
@@ -1514,8 +3465,10 @@ def group_around_coral(school, period, stay):
     global cor, coral_list
     if cor % period == 0:
         school.desire = choice(coral_list)
-    if cor % period < coral_search_time :
+    if cor % period < coral_search_time and not detail.offscreen(school):
         for student in school.students:
+            if detail.skip(student):
+                continue
             if cor % period < stay:
                 if randint(1,2) == 1:
                     student.randomFollow(school.desire, 4)
@@ -1573,8 +3526,7 @@ def ocean_drift():
         ocean_current_value += 1
 
         # CURRENTS SWEEP THINGS OUTSIDE AQUARIUM (BUT THEY SWIM BACK IN)
-        for fish in Eco_Swimmers + bub_list:
-            fish.erase()
+        for fish in ecosystem.view('swimmers', 'bubbles'):
             try:
                 fish_depth  = (fish.position[0])
                 water_depth = (Aquarium.height - Water.position)
@@ -1584,6 +3536,7 @@ def ocean_drift():
                 current_at_depth = 1.0*(ocean_current_drift * (depth_ratio // current_sections))
 
                 fish.position[1] += int(current_at_depth)
+                fish.reindex()
 
             except ZeroDivisionError:
                 pass
@@ -1644,8 +3597,8 @@ class SchoolFactory(object):
 
             # Add current student to list of students
             self.students.append(student)
-            # Draw current student
-            student.draw()
+            # (its size, before it's first drawn by render)
+            student.getPicture()
 
             # iterate
             i += 1
@@ -1661,10 +3614,13 @@ class Generator(object):
 
         # Bounds 
         self.left   = 1
-        self.right  = WIDTH - 1
+        self.right  = WORLD_WIDTH - 1
         self.top    = Water.position + 1
         self.bottom = HEIGHT - 1
 
+        # (scenery is drawn on the stage as it's made, except on the seabed)
+        self.drawing = True
+
     def generate(self, type_list, pos_bounds, n_bounds, color_list, gen_list):
         for species in type_list:
             if len(n_bounds) == 2:
@@ -1692,7 +3648,7 @@ class Generator(object):
                     gen_list.append(current_item)
 
                     # NonMovingThings won't draw themselves upon instantiation, so draw now
-                    if isinstance(current_item, NonMovingThing):
+                    if isinstance(current_item, NonMovingThing) and self.drawing:
                         current_item.draw()
                     i += 1
 
@@ -1706,7 +3662,7 @@ class SeafloorGenerator(Generator):
         Generator.__init__(self)
         self.colors = coral_colors
         self.left   = -7
-        self.right  = WIDTH + 7
+        self.right  = WORLD_WIDTH + 7
         self.bottom = HEIGHT + 1
         self.top    = Sand.position + 1
 
@@ -1714,13 +3670,21 @@ class SeafloorGenerator(Generator):
         self.coral_list = [TreeCoral, BrainCoral]
         self.kelp_list  = [Kelp, LongKelp]
 
+        # (kelp only goes across the window)
+        self.kelp_bounds = (2, WIDTH-2)
+
+    # How many of something there are, when there are [n] of it across the
+    # window (all of them, here)
+    def share(self, n):
+        return n
+
 # Good for generating fish and whales
 class EcosystemGenerator(Generator):
     def __init__(self):
         Generator.__init__(self)
         self.colors = creature_colors
         self.left   = 1
-        self.right  = WIDTH - 1
+        self.right  = WORLD_WIDTH - 1
         self.bottom = HEIGHT - 1
         self.top    = Water.position + 1
 
@@ -1730,11 +3694,9 @@ class EcosystemGenerator(Generator):
 
 #------------------------------ LAYER GENERATORS -------------------------------
 
-def generate_background():
-    global BG_List
-    global BG_Dunes
-    global BG_Kelp
-
+# (the scenery for each layer comes from a SeafloorGenerator, so the seabed's
+#  chunks can be made the same way, see ChunkGenerator)
+def background_scenery(SF):
     ############################################################################
     # generate(self, type_list, pos_bounds, n_bounds, color_list, gen_list)
     ############################################################################
@@ -1742,20 +3704,21 @@ def generate_background():
     SF.generate( type_list=[SmallDune,BigDune,HugeDune,SlopedDune,SlantedDune],
                  pos_bounds=[ (HEIGHT*2//3, HEIGHT-1),
                               (SF.left, SF.right) ],
-                 n_bounds=[background_dunes],
+                 n_bounds=[SF.share(background_dunes)],
                  color_list=[sand_color],
                  gen_list=BG_Dunes )
 
     BG_Kelp = []
     SF.generate( type_list=[Kelp],
                  pos_bounds=[ (SF.top-12, SF.bottom-10),
-                              (2, WIDTH-2) ],
-                 n_bounds=[background_kelp],
+                              SF.kelp_bounds ],
+                 n_bounds=[SF.share(background_kelp)],
                  color_list=[kelp_color],
                  gen_list=BG_Kelp )
 
     #---------------------------------------------------------------------------
-    if underwater_hill == True:
+    # (one hill for each window's width)
+    if underwater_hill == True and SF.share(1):
         # Create an underwater hill
         hill_position = randint(SF.left, SF.right)
         hill_spread   = randint(WIDTH*1//4, WIDTH*1//3)
@@ -1784,6 +3747,14 @@ def generate_background():
                      color_list=coral_colors,
                      gen_list=BG_Kelp )
     #---------------------------------------------------------------------------
+    return BG_Dunes, BG_Kelp
+
+def generate_background():
+    global BG_List
+    global BG_Dunes
+    global BG_Kelp
+
+    BG_Dunes, BG_Kelp = background_scenery(SF)
 
     # creat a consolidated list of Background objects
     BG_List = BG_Dunes + BG_Kelp
@@ -1793,13 +3764,7 @@ def generate_background():
     for item in BG_List:
         item.draw()
 
-def generate_midground():
-    global MG_List
-    global MG_Dunes
-    global MG_TreeCoral
-    global MG_BrainCoral
-    global MG_Kelp
-
+def midground_scenery(SF):
     ############################################################################
     # generate(self, type_list, pos_bounds, n_bounds, color_list, gen_list)
     ############################################################################
@@ -1807,7 +3772,7 @@ def generate_midground():
     SF.generate( type_list=[SmallDune,BigDune,HugeDune,SlopedDune,SlantedDune],
                  pos_bounds=[ (Sand.position-3, HEIGHT-1),
                               (SF.left, SF.right) ],
-                 n_bounds=[midground_dunes],
+                 n_bounds=[SF.share(midground_dunes)],
                  color_list=[sand_color],
                  gen_list=MG_Dunes )
 
@@ -1815,7 +3780,7 @@ def generate_midground():
     SF.generate( type_list=[TreeCoral],
                  pos_bounds=[ (SF.top, SF.bottom),
                               (SF.left, SF.right) ],
-                 n_bounds=[midground_tree_coral],
+                 n_bounds=[SF.share(midground_tree_coral)],
                  color_list=coral_colors,
                  gen_list=MG_TreeCoral )
 
@@ -1823,17 +3788,27 @@ def generate_midground():
     SF.generate( type_list=[BrainCoral],
                  pos_bounds=[ (SF.top, SF.bottom),
                               (SF.left, SF.right) ],
-                 n_bounds=[midground_brain_coral],
+                 n_bounds=[SF.share(midground_brain_coral)],
                  color_list=coral_colors,
                  gen_list=MG_BrainCoral )
 
     MG_Kelp = []
     SF.generate( type_list=[Kelp],
                  pos_bounds=[ (SF.top-12, SF.bottom-10),
-                              (2, WIDTH-2) ],
-                 n_bounds=[midground_kelp],
+                              SF.kelp_bounds ],
+                 n_bounds=[SF.share(midground_kelp)],
                  color_list=[kelp_color],
                  gen_list=MG_Kelp )
+    return MG_Dunes, MG_TreeCoral, MG_BrainCoral, MG_Kelp
+
+def generate_midground():
+    global MG_List
+    global MG_Dunes
+    global MG_TreeCoral
+    global MG_BrainCoral
+    global MG_Kelp
+
+    MG_Dunes, MG_TreeCoral, MG_BrainCoral, MG_Kelp = midground_scenery(SF)
 
     # creat a consolidated list of Background objects
     MG_List = MG_Dunes + MG_TreeCoral + MG_BrainCoral + MG_Kelp
@@ -1843,19 +3818,15 @@ def generate_midground():
     for item in MG_List:
         item.draw()
 
-def generate_foreground():
-    global FG_List
-    global FG_Dunes
-    global FG_Kelp
-    
+def foreground_scenery(SF):
     ############################################################################
     # generate(self, type_list, pos_bounds, n_bounds, color_list, gen_list)
     ############################################################################
     FG_Kelp = []
     SF.generate( type_list=[LongKelp],
                  pos_bounds=[ (Water.position+1, HEIGHT*2//3),
-                              (2, WIDTH-2) ],
-                 n_bounds=[0*scale, 3*scale],
+                              SF.kelp_bounds ],
+                 n_bounds=[SF.share(0*scale), SF.share(3*scale)],
                  color_list=[kelp_color],
                  gen_list=FG_Kelp)
 
@@ -1863,9 +3834,17 @@ def generate_foreground():
     SF.generate( type_list=[HugeDune,SlopedDune,SlantedDune],
                  pos_bounds=[ (HEIGHT-6, HEIGHT-2),
                               (SF.left, SF.right) ],
-                 n_bounds=[0*scale,2*scale],
+                 n_bounds=[SF.share(0*scale), SF.share(2*scale)],
                  color_list=[sand_color],
                  gen_list=FG_Dunes )
+    return FG_Kelp, FG_Dunes
+
+def generate_foreground():
+    global FG_List
+    global FG_Dunes
+    global FG_Kelp
+
+    FG_Kelp, FG_Dunes = foreground_scenery(SF)
 
     # creat a consolidated list of Background objects
     FG_List = FG_Kelp + FG_Dunes 
@@ -1875,6 +3854,32 @@ def generate_foreground():
     for item in FG_List:
         item.draw()
 
+# Bake all the scenery into the background, and mark which cells it covers
+# (so the scenery never has to be drawn again, and creatures just aren't
+# drawn where there is scenery in front of them)
+def bake_scenery():
+    # midground, then the coral and kelp in front of the bottomfeeders
+    SF.DrawList(MG_List)
+    SF.DrawList(MG_TreeCoral)
+    SF.DrawList(MG_Kelp)
+    # Draw long kelp in the front
+    SF.DrawList(FG_Kelp[:scale])
+    SF.DrawList(FG_Dunes)
+    SF.DrawList(FG_Kelp[scale:])
+
+    #set eveything so far as the background environment
+    Aquarium.background = [ row[:] for row in Aquarium.stage ]
+    cover_scenery()
+
+# Mark which cells the scenery covers up
+def cover_scenery():
+    # swimmers are behind the foreground, and bottomfeeders are also behind
+    # the midground coral and kelp
+    Aquarium.cover['foreground'] = Aquarium.coverMask(FG_Kelp + FG_Dunes)
+    Aquarium.cover['midground']  = Aquarium.coverMask(MG_TreeCoral + MG_Kelp,
+                                                      Aquarium.cover['foreground'])
+    Aquarium.bakeDepth()
+
 def generate_ecosystem():
     global Eco_Creatures
     global Eco_Swimmers
@@ -2022,6 +4027,9 @@ def generate_all_schools():
                        [HEIGHT*1//2,WIDTH*5//7],
                        [HEIGHT*2//3,WIDTH*1//7],
                        [HEIGHT*2//3,WIDTH*5//7] ]
+    # (the same again for each screen's worth of a wider world)
+    School_Centers = [ [y, x + screen*WIDTH] for screen in range(screens)
+                                             for y, x in School_Centers ]
 
     # --- SEA MONKEYS! ---#
     #number_of_sea_monkey_schools = 3
@@ -2057,10 +4065,318 @@ def generate_all_schools():
 
     schools = sea_monkey_schools + minnow_schools
 
+    # index of all the sea monkeys (for minnows to hunt)
+
     for school in schools:
         for student in school.students:
             Eco_Swimmers.append(student)
 
+# the lists of creatures the loop goes through, and their groups in the store
+ecosystem_groups = [ ('Eco_Fishies',            'fishies'),
+                     ('Eco_Barracuda',          'barracuda'),
+                     ('Eco_Whales',             'whales'),
+                     ('Eco_BabyWhales',         'baby_whales'),
+                     ('Eco_BabyWhaleFollower',  'calf'),
+                     ('Eco_Jellyfish',          'jellyfish'),
+                     ('Eco_BottomFeeders',      'bottomfeeders'),
+                     ('Eco_Creatures',          'creatures'),
+                     ('Eco_Swimmers',           'swimmers'),
+                     ('bub_list',               'bubbles') ]
+
+# Put every creature in the entity store, and make the lists above its groups
+# (so they can be added to and removed from in O(1), see EntityStore), with
+# the sea monkeys as the prey minnows hunt
+def track_ecosystem():
+    global sea_monkey_grid
+    g = globals()
+    ecosystem.clear()
+    for number, school in enumerate(schools):
+        for student in school.students:
+            ecosystem.add(student, number)
+    for list_name, group in ecosystem_groups:
+        g[list_name] = ecosystem.group(group, g[list_name])
+    ecosystem.group('prey', [ student for school in sea_monkey_schools
+                                      for student in school.students ])
+    sea_monkey_grid = SpatialGrid( ecosystem.view('prey') )
+
+#----------------------------------- SEABED ------------------------------------
+
+# A stretch of the endless seabed (see Seabed), drawn once:  the scenery baked
+# into rows of glyph codes, the cells it covers in front of each layer of
+# creatures, and the corals and kelp on it (for schools to head for)
+class SeabedChunk(object):
+    def __init__(self, index, width):
+        self.index  = index
+        self.left   = index * width
+        self.width  = width
+        self.rows   = [ glyph_row([BLANK] * width) for y in range(HEIGHT) ]
+        self.cover  = { 'midground'  : [ [False] * width for y in range(HEIGHT) ],
+                        'foreground' : [ [False] * width for y in range(HEIGHT) ] }
+        self.corals = []
+        self.size   = 0         # bytes (see bytes())
+
+    # Draw a thing (at its place in the world) on this chunk, and mark the
+    # cells as covered in front of the given layers
+    def paint(self, thing, layers=()):
+        covers = [ self.cover[layer] for layer in layers ]
+        top  = thing.position[0]
+        left = thing.position[1] - self.left
+        blit(self.rows, thing.sprite, thing.color, top, left, (1, HEIGHT-1, 0, self.width), covers)
+        if not isinstance(thing, Dune) and left < self.width and left + thing.size[1] > 0:
+            self.corals.append(thing)
+
+    # Water (if it's drawn) and sand, the same as Surface draws them
+    def paintSurfaces(self):
+        if draw_water == True:
+            glyph = glyphs(Water.color)
+            for y in range(1, Water.position):
+                for x in range(self.width):
+                    if (self.left + x) % 6 == 3*(y % 2) + 1:
+                        self.rows[y][x] = glyph['-']
+            self.rows[Water.position] = glyph_row([glyph['~']] * self.width)
+        if draw_sand == True:
+            glyph = glyphs(Sand.color)
+            for y in range(Sand.position + 1, HEIGHT - 1):
+                step = (HEIGHT - Sand.position) // (y - Sand.position) + 1
+                for x in range(random_int(0, step - 1), self.width, step):
+                    self.rows[y][x] = glyph[',']
+
+    # Rough size in memory (the glyph codes' text is shared)
+    def bytes(self):
+        rows = self.rows + self.cover['midground'] + self.cover['foreground']
+        return sum( sys.getsizeof(row) for row in rows )
+
+# Places the scenery for one chunk of the seabed, the same way as for the
+# window (see background_scenery):  the numbers of things configured are for
+# the width of the window, so each chunk gets its share of them
+class ChunkGenerator(SeafloorGenerator):
+    # (as far past its edges as SeafloorGenerator goes past the world's)
+    margin = 7
+
+    def __init__(self, left, width):
+        SeafloorGenerator.__init__(self)
+        self.drawing = False
+        self.columns = (left, left + width)
+        self.left    = left - self.margin
+        self.right   = left + width + self.margin
+        self.kelp_bounds = self.columns
+
+    # (n for every window's width of seabed, spread evenly over the chunks)
+    def share(self, n):
+        start, end = self.columns
+        return n * end // WIDTH - n * start // WIDTH
+
+# Endless scenery, made a chunk at a time as it scrolls into view
+class Seabed(object):
+    """The seabed for any stretch of the world, in chunks [width] columns wide.
+
+    Each chunk is made from the seed and its index alone (random is reseeded
+    just for it, and put back after), so a chunk comes out the same every
+    time it's made, in any order.  Made chunks are kept in an LRU cache of up
+    to [cache_kb].  The window shows world columns view_x+1 on (inside the
+    border):  scrolling shifts what's there over, and only fills in the
+    columns that came into view.
+    """
+    width = 40
+    # (the widest scenery, SlopedDune)
+    widest = 46
+
+    def __init__(self, cache_kb):
+        self.cache       = OrderedDict()     # index -> chunk (least recent first)
+        self.cache_bytes = cache_kb * 1024
+        self.bytes       = 0
+        self.made        = 0                 # chunks made so far (counting remade ones)
+        # (scenery is placed around its own chunk, but can reach a little past
+        # it, and further on an underwater hill:  as far as the hill spreads,
+        # or the widest scenery, see background_scenery)
+        self.reach       = (ChunkGenerator.margin + max(WIDTH//3, self.widest)) // self.width + 1
+        # (the scenery of the last few chunks, since the next chunk along is
+        # painted with most of the same)
+        self.sceneries   = OrderedDict()     # index -> scenery (see scenery())
+
+    # Run a function with random (and randint) seeded just for [name] (then
+    # put them back, so the rest of the aquarium never knows)
+    def seeded(self, name, function, *args):
+        name = "seabed {} {}".format(SEED, name)
+        state = random_getstate()
+        blocks = random_blocks.getstate()
+        random_seed(name)
+        random_blocks.seed( zlib.crc32(name.encode('utf-8')) )
+        try:
+            return function(*args)
+        finally:
+            random_setstate(state)
+            random_blocks.setstate(blocks)
+
+    #------------------------------ scenery ------------------------------------
+    # The scenery placed in a chunk, layer by layer (in the order it's drawn,
+    # the same as bake_scenery), with the layers of creatures each one covers
+    def scenery(self, index):
+        SF = ChunkGenerator(index * self.width, self.width)
+        BG_Dunes, BG_Kelp = background_scenery(SF)
+        MG_Dunes, MG_TreeCoral, MG_BrainCoral, MG_Kelp = midground_scenery(SF)
+        FG_Kelp, FG_Dunes = foreground_scenery(SF)
+        for thing in BG_Dunes + BG_Kelp + MG_Dunes + MG_TreeCoral + MG_BrainCoral + \
+                     MG_Kelp + FG_Kelp + FG_Dunes:
+            thing.getPicture()
+
+        def by_bottom(things):
+            return sorted(things, key=lambda x: x.position[0] + x.size[0])
+
+        front = ('midground', 'foreground')
+        in_front = SF.share(scale)
+        return [ (by_bottom(BG_Dunes + BG_Kelp), ()),
+                 (by_bottom(MG_Dunes + MG_TreeCoral + MG_BrainCoral + MG_Kelp), ()),
+                 (MG_TreeCoral,           ('midground',)),
+                 (MG_Kelp,                ('midground',)),
+                 (FG_Kelp[:in_front],     front),
+                 (FG_Dunes,               front),
+                 (FG_Kelp[in_front:],     front) ]
+
+    def sceneryOf(self, index):
+        scenery = self.sceneries.pop(index, None)
+        if scenery is None:
+            scenery = self.seeded(index, self.scenery, index)
+        self.sceneries[index] = scenery
+        while len(self.sceneries) > 2 * (2*self.reach + 1):
+            self.sceneries.popitem(last=False)
+        return scenery
+
+    # Draw a chunk:  its surfaces, then each layer of scenery from it and the
+    # chunks around it that reach into it
+    def make(self, index):
+        chunk = SeabedChunk(index, self.width)
+        self.seeded( "{} sand".format(index), chunk.paintSurfaces )
+        sceneries = [ self.sceneryOf(i) for i in range(index - self.reach, index + self.reach + 1) ]
+        for layer in range( len(sceneries[0]) ):
+            for scenery in sceneries:
+                things, layers = scenery[layer]
+                for thing in things:
+                    chunk.paint(thing, layers)
+        chunk.size = chunk.bytes()
+        self.made += 1
+        return chunk
+
+    # A chunk (made if it isn't in the cache, and the least recently used
+    # ones dropped if the cache is full)
+    def chunk(self, index):
+        chunk = self.cache.pop(index, None)
+        if chunk is None:
+            chunk = self.make(index)
+            self.bytes += chunk.size
+        self.cache[index] = chunk
+        while self.bytes > self.cache_bytes and len(self.cache) > 1:
+            old_index, old_chunk = self.cache.popitem(last=False)
+            self.bytes -= old_chunk.size
+        return chunk
+
+    #------------------------------- window ------------------------------------
+    # World columns [start, end) of every row:  the glyphs, and the midground
+    # and foreground covers
+    def strip(self, start, end):
+        strips = [ [ glyph_row(()) for y in range(HEIGHT) ] ] + \
+                 [ [ [] for y in range(HEIGHT) ] for _ in range(2) ]
+        while start < end:
+            chunk = self.chunk(start // self.width)
+            a = start - chunk.left
+            b = min(end - chunk.left, self.width)
+            for strip, grid in zip(strips, [ chunk.rows, chunk.cover['midground'],
+                                             chunk.cover['foreground'] ]):
+                for y in range(1, HEIGHT - 1):
+                    strip[y] += grid[y][a:b]
+            start = chunk.left + b
+        return strips
+
+    # Windows rows the strips go in (background, then covers)
+    def targets(self):
+        return [ Aquarium.background, Aquarium.cover['midground'], Aquarium.cover['foreground'] ]
+
+    # Show the seabed at view_x (all of it, eg. to start with)
+    def show(self):
+        if not Aquarium.background:
+            Aquarium.background = [ row[:] for row in Aquarium.stage ]
+        inside = WIDTH - 2
+        strips = self.strip(view_x + 1, view_x + 1 + inside)
+        for strip, grid in zip(strips, self.targets()):
+            for y in range(1, HEIGHT - 1):
+                grid[y][1:-1] = strip[y]
+        Aquarium.bakeDepth()
+        self.showStage()
+
+    # Move the window [dx] columns along the seabed
+    def scroll(self, dx):
+        global view_x
+        inside = WIDTH - 2
+        if abs(dx) >= inside:
+            view_x += dx
+            self.show()
+            return
+        if dx > 0:
+            strips = self.strip(view_x + 1 + inside, view_x + 1 + inside + dx)
+        else:
+            strips = self.strip(view_x + 1 + dx, view_x + 1)
+        # (the depth of the scenery only has to be worked out for those columns)
+        glyph_strip, midground, foreground = strips
+        strips.append( [ Aquarium.depthOf(midground[y], foreground[y]) for y in range(HEIGHT) ] )
+        for strip, grid in zip(strips, self.targets() + [Aquarium.depth]):
+            for y in range(1, HEIGHT - 1):
+                row = grid[y]
+                if dx > 0:
+                    row[1:-1] = row[1+dx:-1] + strip[y]
+                else:
+                    row[1:-1] = strip[y] + row[1:-1+dx]
+        view_x += dx
+        Aquarium.depth_cells = None
+        self.showStage()
+
+    # (the stage starts over from the background, for creatures to be drawn on)
+    def showStage(self):
+        for y in range(HEIGHT):
+            Aquarium.stage[y][:] = Aquarium.background[y]
+            Aquarium.touch(y, 0, WIDTH)
+
+    # Corals and kelp in the world the creatures swim in now (for schools to
+    # head for), with their positions in it:  the ones on screen, unless the
+    # world is wider than the window
+    def corals(self):
+        # (seabed columns are this far from the creatures' ones)
+        shift = view_x - camera_x
+        seen = set()
+        on_screen = []
+        for index in range( (shift + 1) // self.width, (shift + WORLD_WIDTH - 2) // self.width + 1 ):
+            for coral in self.chunk(index).corals:
+                key = (coral.__class__.__name__, coral.position[0], coral.position[1])
+                x = coral.position[1] - shift
+                if key in seen or x + coral.size[1] < 1 or x > WORLD_WIDTH - 2:
+                    continue
+                seen.add(key)
+                target = copy(coral)
+                target.position = [coral.position[0], x]
+                on_screen.append(target)
+        return on_screen
+
+# Scroll the seabed.  In a world wider than the window, the window moves along
+# it (up to its ends);  otherwise the creatures stay where they are on the
+# screen, and the world goes along with the window
+def scroll_seabed(dx):
+    global coral_list, camera_x
+    if WORLD_WIDTH > WIDTH:
+        dx = max( -camera_x, min(dx, WORLD_WIDTH - WIDTH - camera_x) )
+        if dx == 0:
+            return
+        camera_x += dx
+    # (a replay has to scroll at the same time)
+    if recording is not None:
+        recording['scrolls'].append([tick, dx])
+    seabed.scroll(dx)
+    if WORLD_WIDTH == WIDTH:
+        coral_list = seabed.corals()
+    render()
+    # (when paused, this is displayed and cleaned before the next frame is
+    # hashed, so the rows it touched have to be hashed now)
+    if recording is not None:
+        hash_rows()
+
 #--------------------------- AUTOMATION DURING LOOP ----------------------------
 
 # periodically follow something
@@ -2077,7 +4393,7 @@ def periodic_grouping():
     for barracuda in Eco_Barracuda:
         period = Eco_Barracuda.index(barracuda) * 200 + 500
         stay = Eco_Barracuda.index(barracuda) * 20 + 50
-        if cor % period < stay:
+        if cor % period < stay and not detail.skip(barracuda):
             barracuda.follow(barracuda.findNearest(Eco_Fishies), 2)
 
     # increment cor counter
@@ -2088,7 +4404,10 @@ def periodic_grouping():
 # automate fish and whale moving
 def automate_swimmers():
     # automate moving and fleeing
+    # (fish that are off-screen sit out some loops, to save time)
     for fish in Eco_Fishies:
+        if detail.coast(fish):
+            continue
         fish.randomMove()
         for barracuda in Eco_Barracuda:
             fish.flee(barracuda, 3)
@@ -2096,13 +4415,19 @@ def automate_swimmers():
             fish.flee(whale, 6)
 
     for barracuda in Eco_Barracuda:
+        if detail.coast(barracuda):
+            continue
         barracuda.calmRandomMove()
         barracuda.flee(barracuda.findNearest(Eco_Whales), 4)
 
     for whale in Eco_Whales:
+        if detail.coast(whale):
+            continue
         whale.calmRandomMove()      # This includes the baby whale follower (adds spunk)
 
     for jellyfish in Eco_Jellyfish:
+        if detail.coast(jellyfish):
+            continue
         jellyfish.calmRandomMove(y_rand=20, stop_rand=0, resume_rand=8, turn_rand=0)
 
     # If there's a baby whale following a mother whale, follow it
@@ -2112,38 +4437,39 @@ def automate_swimmers():
     # Schools
     if explorer_school == True:
         for school in schools[1:]:
-            school.automate()
+            school.step()
     else:
         for school in schools:
-            school.automate()
+            school.step()
 
 # automate snail and lobster movement (sparse)
 def automate_bottomfeeders():
     for bottom_feeder in Eco_BottomFeeders:
         if randint(1,50) == 1:
             bottom_feeder.randomMove()
-        else:
-            bottom_feeder.draw()
 
 # schools follow and flee other things
 def school_special_behaviors():
+    # (when short on time, each school only gets a turn every few loops)
     # All fish flee from whales
+    enemy_list = ecosystem.view('whales', 'barracuda')
     for school in schools:
-        enemy_list = Eco_Whales + Eco_Barracuda
+        if detail.staggered(school):
+            continue
         school.everyoneFlee(enemy_list, 4)
 
     # All Sea Monkies flee from Minnows
     for sm_school in sea_monkey_schools:
+        if detail.staggered(sm_school):
+            continue
         for m_school in minnow_schools:
-            sm_school.everyoneFlee(m_school.students, 3)
+            sm_school.everyoneFlee(m_school.grid, 3)
     
     # All Minnows hunt Sea Monkeys
     for m_school in minnow_schools:
-        target_list = []
-        for sm_school in sea_monkey_schools:
-            for student in sm_school.students:
-                target_list.append(student)
-        m_school.everyoneHunt(target_list, 2)
+        if detail.staggered(m_school):
+            continue
+        m_school.everyoneHunt(sea_monkey_grid, 2)
 
     # EXPLORER SCHOOL
     if explorer_school == True:
@@ -2154,7 +4480,7 @@ def school_special_behaviors():
             for student in school.students:
                 choice([student.randomMove(), student.calmRandomMove()])
         else:
-            school.automate()
+            school.step()
 
 # create bubbles and drift them up
 def automate_bubbles():
@@ -2162,77 +4488,1222 @@ def automate_bubbles():
         # randomly create bubbles to float up
         create_bubbles()
         # Drift all bubbles (in foreground)
-        for bubble in bub_list:
+        # (backwards, since a popped bubble's place is taken by the last one)
+        for i in range(len(bub_list) - 1, -1, -1):
+            bubble = bub_list[i]
             bubble.drift()
             if bubble.position[0] <= ( Water.position - 5):
-                bub_list.remove(bubble)
+                ecosystem.remove(bubble)
 
-# remove creatures if there are too many and program is too slow
-def reduce_ecosystem(count):
-    # Target ratio for seamonkeys / minnows
-    ratio = 5
+# ocean currents move all the swimmers
+def ocean_current():
+    if periodic_ocean_current_drift == True:
+        ocean_drift()
 
-    #---------------------------------------------------------------------------
-    # if there are no fish to remove, don't attempt to
-    if len(schools) == 0 or len(Eco_Swimmers) == 0:
+# Draw everything where it ended up in this loop, in one pass:  every creature
+# and bubble goes in front of or behind the scenery and the others by its depth
+# (not by the order they're in), and each cell of the stage is written once
+# (the swarm engine's students are drawn all at once, from the entity store)
+def render():
+    things = ecosystem.view('bottomfeeders', 'swimmers', 'bubbles')
+    Aquarium.composite( things, schooled(things) )
+
+# Which of the things render() draws are moved by a swarm engine:  where they
+# are in the list, their rows, and their depth * len(things) + where they are
+# (or None, without any), worked out again only when things come or go
+schooled_things = (None, None, None)
+
+def schooled(things):
+    global schooled_things
+    if not any( school.engine is not None for school in schools ):
+        return None
+    if schooled_things[0] is not things or schooled_things[1] != ecosystem.version:
+        rows = ecosystem.rows
+        row = np.array([ rows[thing.entity] for thing in things ], dtype=int)
+        engines = np.array([ school.engine is not None for school in schools ] + [False])
+        index = np.flatnonzero( engines[ ecosystem.numbers('school')[row] ] )
+        depth = np.array([ things[i].depth for i in index.tolist() ], dtype=int)
+        schooled_things = ( things, ecosystem.version,
+                            (index, row[index], depth * len(things) + index) )
+    return schooled_things[2]
+
+# Everything that happens in one loop (before displaying), in order
+loop_phases = [
+    ('ocean_current',               ocean_current),
+    #-------------------------- ocean floor --------------------------------
+    # (scenery is baked into the background, see bake_scenery)
+    ('automate_bottomfeeders',      automate_bottomfeeders),
+    #--------------------------- swimmers ----------------------------------
+    ('automate_swimmers',           automate_swimmers),
+    ('periodic_grouping',           periodic_grouping),
+    ('school_special_behaviors',    school_special_behaviors),
+    #----------------------- active foreground -----------------------------
+    ('automate_bubbles',            automate_bubbles),
+    #------------------------------ drawing --------------------------------
+    ('render',                      render),
+]
+
+# Run one loop of the simulation (everything except displaying it)
+# (and time each phase, if given a PhaseProfiler)
+def simulate(profiler=None):
+    global tick
+    Aquarium.draws = 0
+    Aquarium.writes = 0
+    for name, phase in loop_phases:
+        if profiler is None:
+            phase()
+        else:
+            profiler.measure(name, phase)
+    tick += 1
+
+#-------------------------------- BENCHMARKS -----------------------------------
+
+# time a function, and return the average time per call (in seconds)
+def time_per_call(function, calls):
+    t_start = time()
+    for _ in range(calls):
+        function()
+    return (time() - t_start) / calls
+
+# redraw the midground with colored() for every cell vs. with the glyph cache
+def benchmark_glyphs(frames=200):
+    global glyphs
+    cells = 0
+    for item in MG_List:
+        item.getPicture()
+        cells += item.size[0] * item.size[1]
+
+    # (sprites keep the glyph codes they're blitted with, so start them over)
+    def redraw():
+        for sprite in sprites.values():
+            sprite.run_codes.clear()
+        SF.DrawList(MG_List)
+
+    cached_glyphs = glyphs
+    glyphs = lambda color, attrs=(): UncachedGlyphTable(color, attrs)
+    t_colored = time_per_call(redraw, frames)
+    glyphs = cached_glyphs
+    t_cached = time_per_call(redraw, frames)
+
+    print("redraw MG_List ({} objects, {} cells), {} frames".format(
+                                            len(MG_List), cells, frames))
+    print("  colored() per cell:  {:8.3f} ms/frame".format(1000*t_colored))
+    print("  glyph cache:         {:8.3f} ms/frame".format(1000*t_cached))
+    print("  speedup:             {:8.1f}x".format(t_colored / max(t_cached, 1e-9)))
+
+# find the nearest schoolmate by scanning the school vs. with the spatial grid
+def benchmark_neighbors(rounds=20, warmup=200):
+    students = [student for school in schools for student in school.students]
+
+    # (let the schools spread out from where they were created)
+    for _ in range(warmup):
+        automate_swimmers()
+        periodic_grouping()
+        school_special_behaviors()
+
+    def scan():
+        for school in schools:
+            for student in school.students:
+                student.findNearest(school.students)
+                student.findNearest(school.students, 'mouth')
+
+    def lookup():
+        for school in schools:
+            for student in school.students:
+                student.findNearest(school.grid)
+                student.findNearest(school.grid, 'mouth')
+
+    # both ways have to find the same fish
+    mismatches = 0
+    for school in schools:
+        for student in school.students:
+            for side in ['tail', 'mouth']:
+                if student.findNearest(school.students, side) is not \
+                   student.findNearest(school.grid, side):
+                    mismatches += 1
+
+    t_scan   = time_per_call(scan, rounds)
+    t_lookup = time_per_call(lookup, rounds)
+
+    print("findNearest for {} fish in {} schools, {} rounds".format(
+                                        len(students), len(schools), rounds))
+    print("  scan whole school:   {:8.3f} ms/round".format(1000*t_scan))
+    print("  spatial grid:        {:8.3f} ms/round".format(1000*t_lookup))
+    print("  speedup:             {:8.1f}x".format(t_scan / max(t_lookup, 1e-9)))
+    print("  mismatches:          {:8d}".format(mismatches))
+
+# move big schools of every type fish by fish vs. with the swarm engine
+def benchmark_swarm(school_size=2000, rounds=5):
+    if np is None:
+        print("the swarm engine needs numpy")
         return
-    # if count is 0, make it 1
-    count = 1 if count == 0 else count
 
-    #---------------------------------------------------------------------------
-    # remove [count] fish from the aquarium
-    for _ in range(int(count)):
-        # get ratio of seamonkeys to minonows
-        total_sea_monkeys = 0
-        for school in sea_monkey_schools:
-            total_sea_monkeys += len(school.students)
-        total_minnows = 0
-        for school in minnow_schools:
-            total_minnows += len(school.students)
+    print("one step of a {} fish school, {} rounds".format(school_size, rounds))
+    print("  {:12}  {:>10}  {:>10}  {:>7}".format("SCHOOL TYPE", "by fish", "engine", "speedup"))
+    for SchoolType in [Monarch, Tree, Line, Circle, Neighbor, ShyNeighbor]:
+        factory = SchoolFactory( SchoolType=SchoolType, SchoolSize=school_size,
+                                 AnimalType=SeaMonkey,
+                                 SchoolCenter=[HEIGHT//2, WIDTH//2] )
+        school = factory.CreateSchool()
+        engine = SwarmEngine(school)
+        # (let the school spread out first)
+        for _ in range(10):
+            engine.automate()
+
+        t_objects = time_per_call(school.automate, rounds)
+        t_engine  = time_per_call(engine.automate, rounds)
+        print("  {:12}  {:7.1f} ms  {:7.1f} ms  {:6.1f}x".format(
+                SchoolType.__name__, 1000*t_objects, 1000*t_engine,
+                t_objects / max(t_engine, 1e-9)))
+
+    # (and a school ten times the size, with the engine alone)
+    factory = SchoolFactory( SchoolType=Monarch, SchoolSize=10*school_size,
+                             AnimalType=SeaMonkey, SchoolCenter=[HEIGHT//2, WIDTH//2] )
+    engine = SwarmEngine( factory.CreateSchool() )
+    for _ in range(10):
+        engine.automate()
+    t_engine = time_per_call(engine.automate, rounds)
+    print("  {:12}  {:>10}  {:7.1f} ms  ({} fish)".format(
+            "Monarch", "", 1000*t_engine, 10*school_size))
+
+# save and restore the whole aquarium (see SNAPSHOTS), vs. pickling it
+def benchmark_snapshot(rounds=20, warmup=100):
+    # (let the aquarium get going, so there are bubbles and corals to head for)
+    for _ in range(warmup):
+        simulate()
+
+    data = snapshot()
+    t_save    = time_per_call(snapshot, rounds)
+    t_restore = time_per_call(lambda: restore_snapshot(data), rounds)
+
+    g = globals()
+    state = dict( (name, g[name]) for name in
+                  snapshot_thing_lists + snapshot_school_lists + snapshot_counters )
+    state['background'] = Aquarium.background
+    pickled = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    t_unpickle = time_per_call(lambda: pickle.loads(pickled), rounds)
+
+    print("whole aquarium ({}x{}, {} creatures, {} schools), {} rounds".format(
+            WIDTH, HEIGHT + 1, len(Eco_Swimmers) + len(Eco_BottomFeeders),
+            len(schools), rounds))
+    print("  {:10}  {:>9}  {:>10}  {:>10}".format("", "size", "save", "load"))
+    print("  {:10}  {:7.1f}kB  {:7.2f} ms  {:7.2f} ms".format(
+            "snapshot", len(data) / 1024.0, 1000*t_save, 1000*t_restore))
+    print("  {:10}  {:7.1f}kB  {:>10}  {:7.2f} ms".format(
+            "pickle", len(pickled) / 1024.0, "", 1000*t_unpickle))
+    print("  snapshot is {:.1f}x smaller".format( len(pickled) / float(len(data)) ))
+
+# bytes per fish (and bubble) with __slots__, vs. the same attributes kept in
+# a __dict__ (the way things used to be)
+def benchmark_memory(count=10000):
+    if tracemalloc is None:
+        print("the memory benchmark needs tracemalloc (python 3)")
+        return
+
+    class DictThing(object):
+        pass
+
+    def bytes_each(make):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        things = [ make() for _ in range(count) ]
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        return used / float(len(things))
+
+    def fish_after():
+        fish = SeaMonkey( [randint(1, HEIGHT), randint(1, WIDTH)], choice(creature_colors) )
+        fish.getPicture()
+        fish.drawn = fish.sprite
+        return fish
+
+    def fish_before():
+        fish = DictThing()
+        fish.position   = [randint(1, HEIGHT), randint(1, WIDTH)]
+        fish.speed      = 1
+        fish.maxspeed   = 2
+        fish.color      = choice(creature_colors)
+        fish.direction  = [0, choice([-1,1])]
+        fish.sprite     = get_sprite(SeaMonkey([0,0], 'red'), 'left')
+        fish.size       = fish.sprite.size
+        fish.picture    = fish.sprite.picture
+        fish.drawn      = fish.sprite
+        fish.accelerate = 1
+        fish.grids      = ()
+        return fish
+
+    def bubble_after():
+        bubble = Bubble( [HEIGHT-5, randint(1, WIDTH)], choice(bubble_colors) )
+        bubble.direction[1] = 1
+        bubble.getPicture()
+        bubble.drawn = bubble.sprite
+        return bubble
+
+    def bubble_before():
+        bubble = fish_before()
+        bubble.maxspeed    = 1
+        now                = datetime.now()
+        bubble.year        = now.year
+        bubble.month       = now.month
+        bubble.month_name  = now.strftime('%b')
+        bubble.day         = now.day
+        bubble.hour        = int(now.strftime('%I'))
+        bubble.minute      = now.minute
+        bubble.second      = now.second
+        bubble.ampm        = now.strftime('%p').lower()
+        bubble.word        = "puppies"
+        bubble.left        = Bubble._left1.__get__(bubble)
+        bubble.right       = Bubble._right1.__get__(bubble)
+        return bubble
+
+    print("bytes each, for {} of them".format(count))
+    print("  {:8}  {:>9}  {:>9}  {:>7}".format("", "__dict__", "__slots__", "saved"))
+    for name, before, after in [ ('fish',   fish_before,   fish_after),
+                                 ('bubble', bubble_before, bubble_after) ]:
+        b_before = bytes_each(before)
+        b_after  = bytes_each(after)
+        print("  {:8}  {:9.0f}  {:9.0f}  {:6.0f}%".format(
+                name, b_before, b_after, 100 * (1 - b_after / b_before)))
+
+    # the stage and background:  rows of glyph codes, vs. lists of the colored
+    # strings (the way they used to be, each string shared by all its cells)
+    rows = Aquarium.stage + Aquarium.background
+    cells = sum( len(row) for row in rows )
+    texts = set( glyph_text[code] for row in rows for code in row )
+    shared = sum( sys.getsizeof(text) for text in texts )
+    b_before = ( sum( sys.getsizeof([ glyph_text[code] for code in row ]) for row in rows )
+                 + shared ) / float(cells)
+    b_after  = ( sum( sys.getsizeof(row) for row in rows ) + shared ) / float(cells)
+    print("")
+    print("bytes per cell of the stage and background ({} cells, {} glyphs)".format(
+            cells, len(texts)))
+    print("  {:8}  {:>9}  {:>9}  {:>7}".format("", "strings", "codes", "saved"))
+    print("  {:8}  {:9.1f}  {:9.1f}  {:6.0f}%".format(
+            "cell", b_before, b_after, 100 * (1 - b_after / b_before)))
+
+# removing fish that are in several lists:  list.remove() from each of them,
+# vs. the entity store's swap-remove (and a union of lists, vs. a cached view)
+def benchmark_store(count=20000):
+    fish = [ SeaMonkey([randint(1, HEIGHT), randint(1, WIDTH)], choice(creature_colors))
+             for _ in range(count) ]
+    unlucky = fish[:]
+    for i in range(len(unlucky) - 1, 0, -1):
+        j = random_int(0, i)
+        unlucky[i], unlucky[j] = unlucky[j], unlucky[i]
+    names = ['swimmers', 'fishies', 'creatures']
+
+    lists = dict( (name, list(fish)) for name in names )
+    t_union = time_per_call(lambda: lists['swimmers'] + lists['fishies'], 100)
+    t_start = time()
+    for thing in unlucky:
+        for name in names:
+            lists[name].remove(thing)
+    t_lists = time() - t_start
+
+    store = EntityStore()
+    for name in names:
+        store.group(name, fish)
+    store.view('swimmers', 'fishies')
+    t_view = time_per_call(lambda: store.view('swimmers', 'fishies'), 100)
+    t_start = time()
+    for thing in unlucky:
+        store.remove(thing)
+    t_store = time() - t_start
+
+    print("removing {} fish (in {} lists each) in random order".format(count, len(names)))
+    print("  {:14}  {:>9}  {:>14}".format("", "remove", "union of two"))
+    print("  {:14}  {:7.3f} s  {:11.3f} ms".format("list.remove", t_lists, 1000*t_union))
+    print("  {:14}  {:7.3f} s  {:11.3f} ms".format("entity store", t_store, 1000*t_view))
+    print("  swap-remove is {:.0f}x faster".format( t_lists / t_store ))
+
+# cost of each randint() call, from blocks vs. the old wrapper around
+# random.randint()  (with the bounds the loop uses most)
+def benchmark_random(calls=1000000):
+    def old_randint(a,b):
+        X = int(min(a,b))
+        Y = int(max(a,b))
+        return random_int(X,Y)
+
+    def calls_of(function):
+        def run():
+            for _ in range(calls // 4):
+                function(1,6)
+                function(-1,1)
+                function(-2,2)
+                function(1,50)
+        return run
+
+    t_old    = time_per_call(calls_of(old_randint), 1) / calls
+    t_python = time_per_call(calls_of(random_int), 1) / calls
+    t_blocks = time_per_call(calls_of(randint), 1) / calls
+
+    print("{} calls to randint(), blocks of {} ({})".format(
+            calls, RandomBlocks.block, "numpy" if np is not None else "random.Random"))
+    print("  {:24}  {:7.3f} us".format("old wrapper", 1e6*t_old))
+    print("  {:24}  {:7.3f} us".format("random.randint", 1e6*t_python))
+    print("  {:24}  {:7.3f} us".format("RandomBlocks.randint", 1e6*t_blocks))
+    print("  blocks are {:.1f}x faster than the old wrapper".format( t_old / t_blocks ))
+
+# scrolling the seabed into new chunks, back over cached ones, and showing
+# all of it at once  (and whether a chunk comes out the same when it's made
+# again, after being dropped from the cache)
+def benchmark_seabed(steps=200, rounds=20):
+    global seabed
+    if seabed is None:
+        seabed = Seabed(seabed_cache_kb)
+        seabed.show()
+    start = [ row[:] for row in Aquarium.background ]
+
+    t_new = time_per_call(lambda: seabed.scroll(scroll_step), steps)
+    made = seabed.made
+    t_cached = time_per_call(lambda: seabed.scroll(-scroll_step), steps)
+    remade = seabed.made - made
+    t_show = time_per_call(seabed.show, rounds)
+
+    print("seabed ({}x{}, chunks {} wide, cache {}kB), {} scrolls of {} columns".format(
+            WIDTH, HEIGHT + 1, Seabed.width, seabed_cache_kb, steps, scroll_step))
+    print("  {:24}  {:7.3f} ms".format("scroll into new chunks", 1000*t_new))
+    print("  {:24}  {:7.3f} ms".format("scroll back", 1000*t_cached))
+    print("  {:24}  {:7.3f} ms".format("show everything", 1000*t_show))
+    print("  {} chunks made, {} made again on the way back, {} cached ({:.0f}kB)".format(
+            made, remade, len(seabed.cache), seabed.bytes / 1024.0))
+    print("  back at the start:  {}".format(
+            "same" if Aquarium.background == start else "DIFFERENT"))
+
+# loops with everything off the screen coasting along (see
+# DetailController.steps), then at full detail -- eg. with --world ten times
+# the window's width
+def benchmark_world(loops=200):
+    global offscreen_lod
+    on_screen = sum( 1 for creature in ecosystem.things if detail.distance(creature) == 0 )
+    # (both start from the same aquarium)
+    start = snapshot()
+    t_full = t_lod = 0.0
+    for lod in (True, False):
+        offscreen_lod = lod
+        restore_snapshot(start)
+        t = time_per_call(simulate, loops)
+        if lod:
+            t_lod = t
+        else:
+            t_full = t
+
+    print("world {} wide ({} screens), {} creatures and bubbles ({} on screen), {} loops".format(
+            WORLD_WIDTH, screens, len(ecosystem.things), on_screen, loops))
+    print("  {:24}  {:7.3f} ms".format("off screen, coasting", 1000*t_lod))
+    print("  {:24}  {:7.3f} ms".format("off screen, full detail", 1000*t_full))
+    print("  coasting is {:.1f}x faster".format( t_full / t_lod ))
+
+# drawing a sprite cell by cell (the way Thing.draw and Dune.draw used to)
+# vs. blitting it a run at a time:  a SlopedDune, and a school of one-cell
+# SeaMonkeys (and the school composited cell by cell vs. in one batch)
+def benchmark_blit(rounds=200, school=500):
+    bounds = (1, HEIGHT-1, 1, WIDTH-1)
+    start = [ row[:] for row in Aquarium.stage ]
+    rows = [ row[:] for row in start ]
+
+    def cell_by_cell(sprite, color, top, left):
+        glyph = glyphs(color)
+        for y, x, char in sprite.cells:
+            y += top
+            x += left
+            if 0 < y < (HEIGHT-1) and 0 < x < (WIDTH-1):
+                rows[y][x] = glyph[char]
+
+    # (the same cells have to come out of each way)
+    def result(draw):
+        rows[:] = [ row[:] for row in start ]
+        draw()
+        return [ row[:] for row in rows ]
+
+    # a dune hanging off the right edge
+    dune = SlopedDune( [HEIGHT - 9, WIDTH - 30], choice(sand_colors) )
+    dune.getPicture()
+    top, left = dune.position
+    dune_cells = lambda: cell_by_cell(dune.sprite, dune.color, top, left)
+    dune_blit  = lambda: blit(rows, dune.sprite, dune.color, top, left, bounds)
+
+    # a school, some of it outside the window
+    fish = SeaMonkey( [0, 0], choice(creature_colors) )
+    fish.direction = [0, -1]
+    fish.getPicture()
+    tops  = [ randint(-2, HEIGHT + 1) for _ in range(school) ]
+    lefts = [ randint(-2, WIDTH + 1) for _ in range(school) ]
+    def school_cells():
+        for y, x in zip(tops, lefts):
+            cell_by_cell(fish.sprite, fish.color, y, x)
+    def school_blits():
+        for y, x in zip(tops, lefts):
+            blit(rows, fish.sprite, fish.color, y, x, bounds)
+
+    print("blits ({}x{}), {} rounds".format(WIDTH, HEIGHT + 1, rounds))
+    print("  {:28}  {:>9}  {:>9}  {:>7}".format("", "per cell", "blit", "speedup"))
+    t_cells = time_per_call(dune_cells, rounds)
+    t_blit  = time_per_call(dune_blit, rounds)
+    print("  {:28}  {:6.3f} ms  {:6.3f} ms  {:6.1f}x  ({})".format(
+            "SlopedDune ({} cells)".format(len(dune.sprite.cells)), 1000*t_cells, 1000*t_blit,
+            t_cells / max(t_blit, 1e-9),
+            "same" if result(dune_cells) == result(dune_blit) else "DIFFERENT"))
+    t_cells = time_per_call(school_cells, rounds)
+    t_blit  = time_per_call(school_blits, rounds)
+    print("  {:28}  {:6.3f} ms  {:6.3f} ms  {:6.1f}x  ({})".format(
+            "school of {}".format(school), 1000*t_cells, 1000*t_blit,
+            t_cells / max(t_blit, 1e-9),
+            "same" if result(school_cells) == result(school_blits) else "DIFFERENT"))
+    if np is None:
+        return
 
+    # the same school, put on the stage by Window.composite cell by cell, vs.
+    # all at once from the entity store (the way render draws the swarm
+    # engine's students)
+    students = []
+    for y, x in zip(tops, lefts):
+        student = SeaMonkey( [y, x + camera_x], fish.color )
+        student.direction = [0, -1]
+        ecosystem.add(student)
+        students.append(student)
+    index = np.arange(school)
+    rows  = np.array([ ecosystem.rows[student.entity] for student in students ], dtype=int)
+    batch = (index, rows, SeaMonkey.depth * school + index)
+    composite_cells = lambda: Aquarium.composite(students)
+    composite_batch = lambda: Aquarium.composite(students, batch)
+
+    def composited(draw):
+        saved = [ row[:] for row in Aquarium.stage ], Aquarium.shown, Aquarium.pictured
+        Aquarium.shown, Aquarium.pictured = {}, None
+        draw()
+        stage = [ row[:] for row in Aquarium.stage ]
+        Aquarium.stage[:], Aquarium.shown, Aquarium.pictured = saved
+        return stage
+
+    print("  {:28}  {:>9}  {:>9}".format("", "per cell", "batched"))
+    t_cells = time_per_call(composite_cells, rounds)
+    t_batch = time_per_call(composite_batch, rounds)
+    print("  {:28}  {:6.3f} ms  {:6.3f} ms  {:6.1f}x  ({})".format(
+            "composite, school of {}".format(school), 1000*t_cells, 1000*t_batch,
+            t_cells / max(t_batch, 1e-9),
+            "same" if composited(composite_cells) == composited(composite_batch) else "DIFFERENT"))
+
+benchmarks = {
+    'glyphs'    : benchmark_glyphs,
+    'blit'      : benchmark_blit,
+    'neighbors' : benchmark_neighbors,
+    'swarm'     : benchmark_swarm,
+    'snapshot'  : benchmark_snapshot,
+    'memory'    : benchmark_memory,
+    'store'     : benchmark_store,
+    'random'    : benchmark_random,
+    'seabed'    : benchmark_seabed,
+    'world'     : benchmark_world,
+}
+
+
+#------------------------------ RECORD / REPLAY --------------------------------
+
+# hash of the characters on the stage (without colors, so it's the same
+# whether or not termcolor decided to color things)
+# (rows are kept without their colors, and only the touched rows are redone)
+hashed_rows = []
+
+def hash_rows():
+    if not hashed_rows:
+        hashed_rows.extend( ''.join([ glyph_chars[code] for code in row ]) for row in Aquarium.stage )
+    else:
+        for y in Aquarium.dirty:
+            hashed_rows[y] = ''.join([ glyph_chars[code] for code in Aquarium.stage[y] ])
+
+def frame_hash():
+    hash_rows()
+    digest = hashlib.sha1()
+    for row in hashed_rows:
+        digest.update( row.encode('utf-8') )
+    return digest.hexdigest()[:16]
+
+# start recording a session (saved when the aquarium exits)
+def start_recording(path):
+    global recording
+    recording = {
+        'version'   : 1,
+        'seed'      : SEED,
+        'width'     : WIDTH,
+        'height'    : HEIGHT + 1,
+        'swarm'     : swarm_engine,
+        'scroll'    : scrolling_seabed,
+        'world'     : WORLD_WIDTH,
+        'frames'    : [],           # frame_hash() after each loop
+        'detail'    : [],           # [tick, level] for each change of detail
+        'scrolls'   : [],           # [tick, columns] for each scroll of the seabed
+    }
+    # (it starts from a saved aquarium, not from the seed)
+    if restoring is not None:
+        recording['snapshot'] = base64.b64encode(restoring).decode('ascii')
+    atexit.register(save_recording, path)
+
+def save_recording(path):
+    # (nothing to save in the drawing process, when the simulation is split off)
+    if recording is None:
+        return
+    with open(path, 'w') as f:
+        json.dump(recording, f)
+
+# remember this frame (if recording)
+def record_frame():
+    if recording is not None:
+        recording['frames'].append( frame_hash() )
+
+# re-run a recorded session, and check that every frame comes out the same
+def run_replay(session):
+    detail_levels = dict( session.get('detail', []) )
+    scrolls = {}
+    for scroll_tick, dx in session.get('scrolls', []):
+        scrolls.setdefault(scroll_tick, []).append(dx)
+
+    mismatches = []
+    for expected in session['frames']:
+        simulate()
+        if frame_hash() != expected:
+            mismatches.append(tick)
+        Aquarium.clean()
+        # (detail was changed here)
+        if tick in detail_levels:
+            detail.setLevel( detail_levels[tick] )
+        # (and the seabed was scrolled here)
+        for dx in scrolls.get(tick, []):
+            scroll_seabed(dx)
+
+    print( json.dumps( { 'seed'          : SEED,
+                         'ticks'         : len(session['frames']),
+                         'mismatches'    : len(mismatches),
+                         'first_mismatch': mismatches[0] if mismatches else None },
+                       indent=2, sort_keys=True ) )
+    return len(mismatches) == 0
+
+#--------------------------------- SNAPSHOTS -----------------------------------
+
+# A saved aquarium is the header (so the size and seed are known before
+# anything is made), then everything else zlib-compressed:  a table of
+# strings (class names, colors, glyphs...) that everything else refers to by
+# number, the baked background, every thing (scenery and creatures), the
+# lists they're in, and the schools.
+
+# lists of things, lists of schools, and counters that are saved (by name)
+snapshot_thing_lists  = [ 'BG_Dunes', 'BG_Kelp', 'BG_List',
+                          'MG_Dunes', 'MG_TreeCoral', 'MG_BrainCoral', 'MG_Kelp', 'MG_List',
+                          'FG_Kelp', 'FG_Dunes', 'FG_List', 'coral_list',
+                          'Eco_Fishies', 'Eco_Barracuda', 'Eco_Whales', 'Eco_BabyWhales',
+                          'Eco_BabyWhaleFollower', 'Eco_Jellyfish', 'Eco_BottomFeeders',
+                          'Eco_Creatures', 'Eco_Swimmers', 'bub_list' ]
+snapshot_school_lists = [ 'schools', 'sea_monkey_schools', 'minnow_schools' ]
+snapshot_counters     = [ 'tick', 'cor', 'bub', 'ocean_current_value', 'ocean_current_count',
+                          'view_x', 'camera_x' ]
+
+class SnapshotWriter(object):
+    def __init__(self):
+        self.strings = {}
+        self.chunks = []
+
+    def string(self, text):
         try:
-            sm_m_ratio = (total_sea_monkeys // total_minnows)
-        except ZeroDivisionError:
-            sm_m_ratio = ratio + 1
-
-        #-----------------------------------------------------------------------
-        # choose a school at random
-        unlucky_class = []
-        class_selection_count = 0
-        while len(unlucky_class) < 1 and class_selection_count < 10:
-            class_selection_count += 1
-
-            #----------------------------------------------
-            # extra seamonkeys
-            if sm_m_ratio > ratio:
-                unlucky_school = choice(sea_monkey_schools)
-            # extra minnows
-            elif sm_m_ratio < ratio:
-                unlucky_school = choice(minnow_schools)
-            # right at the ratio
+            return self.strings[text]
+        except KeyError:
+            number = self.strings[text] = len(self.strings)
+            return number
+
+    def pack(self, fmt, *values):
+        self.chunks.append( struct.pack('<' + fmt, *values) )
+
+    def numbers(self, values):
+        self.pack('I{}i'.format(len(values)), len(values), *values)
+
+    def getvalue(self):
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, WIDTH, HEIGHT + 1, SEED)
+        table = [ struct.pack('<I', len(self.strings)) ]
+        for text in sorted(self.strings, key=self.strings.get):
+            data = text.encode('utf-8')
+            table.append( struct.pack('<I', len(data)) + data )
+        return header + zlib.compress( b''.join(table + self.chunks), 9 )
+
+class SnapshotReader(object):
+    def __init__(self, data):
+        self.data = zlib.decompress( data[SNAPSHOT_HEADER.size:] )
+        self.offset = 0
+        self.strings = []
+        for _ in range( self.unpack('I')[0] ):
+            size = self.unpack('I')[0]
+            self.strings.append( self.data[self.offset : self.offset+size].decode('utf-8') )
+            self.offset += size
+
+    def unpack(self, fmt):
+        fmt = '<' + fmt
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def number(self):
+        return self.unpack('i')[0]
+
+    def numbers(self):
+        return list( self.unpack('{}i'.format( self.unpack('I')[0] )) )
+
+    def string(self):
+        return self.strings[ self.number() ]
+
+# Save everything about the aquarium as it is now
+def snapshot():
+    out = SnapshotWriter()
+    g = globals()
+
+    # counters, level of detail, and the surfaces
+    out.numbers( [ g[name] for name in snapshot_counters ] + [detail.level] )
+    for surface in (Water, Sand):
+        out.numbers( [ surface.position, out.string(surface.color) ] )
+
+    # background (with the scenery baked in)
+    out.numbers( [ out.string(glyph_text[code]) for row in Aquarium.background for code in row ] )
+
+    # every thing in the lists (once each):  class, color, position,
+    # direction, speed, which way it faces (which isn't always the direction,
+    # eg. when it's stopped), and its own fields (methods are saved by name)
+    things = []
+    index = {}
+    for name in snapshot_thing_lists:
+        for thing in g[name]:
+            if id(thing) not in index:
+                index[id(thing)] = len(things)
+                things.append(thing)
+    out.pack('I', len(things))
+    for thing in things:
+        direction = getattr(thing, 'direction', [0,0])
+        facing = thing.sprite.facing
+        out.pack('8i', out.string(thing.__class__.__name__), out.string(thing.color),
+                 thing.position[0], thing.position[1], direction[0], direction[1],
+                 getattr(thing, 'speed', 0), -1 if facing is None else out.string(facing))
+        fields = []
+        for field in thing.snapshot_fields:
+            value = getattr(thing, field)
+            if callable(value):
+                fields += [ out.string(field), 1, out.string(value.__name__) ]
+            elif isinstance(value, int):
+                fields += [ out.string(field), 0, value ]
             else:
-                unlucky_school = choice(schools)
-            #----------------------------------------------
+                fields += [ out.string(field), 2, out.string(value) ]
+        out.numbers(fields)
+    for name in snapshot_thing_lists:
+        out.numbers( [ out.string(name) ] + [ index[id(thing)] for thing in g[name] ] )
+
+    # schools:  type, how they lead and follow, students, who follows who
+    # ("0" is the leader), and the coral they're heading for
+    all_schools = list(schools)
+    for name in snapshot_school_lists:
+        all_schools += [ school for school in g[name] if school not in all_schools ]
+    out.pack('I', len(all_schools))
+    for school in all_schools:
+        desire = getattr(school, 'desire', None)
+        out.numbers( [ out.string(school.__class__.__name__),
+                       out.string(school.LeadType), out.string(school.FollowType),
+                       school.FollowDistance,
+                       index[id(desire)] if id(desire) in index else -1 ] )
+        out.numbers( [ index[id(student)] for student in school.students ] )
+        out.numbers( [ -1 if leader == '0' else index[id(leader)]
+                       for leader in school.following_order ] )
+    for name in snapshot_school_lists:
+        out.numbers( [ out.string(name) ] + [ all_schools.index(school) for school in g[name] ] )
+
+    return out.getvalue()
+
+def save_snapshot():
+    # (nothing to save in the drawing process, when the simulation is split off)
+    if snapshot_path is None:
+        return
+    with open(snapshot_path, 'wb') as f:
+        f.write( snapshot() )
+
+# Classes descended from [base], by name
+def subclasses(base):
+    found = {}
+    for cls in base.__subclasses__():
+        found[cls.__name__] = cls
+        found.update( subclasses(cls) )
+    return found
+
+# A name from a saved aquarium, if it's one of the [allowed] ones (the file
+# only gets to make things, schools and lists the aquarium has)
+def saved_name(name, allowed):
+    if name not in allowed:
+        raise ValueError("a saved aquarium can't have {!r}".format(name))
+    return name
+
+# Methods of a thing's class (the ones a saved field can be, eg. how a
+# bubble draws itself), without python's own
+def methods_of(thing):
+    return set( name for name in dir(thing.__class__)
+                if not name.startswith('__') and callable(getattr(thing.__class__, name)) )
+
+# Bring back a saved aquarium (instead of generating a new one)
+def restore_snapshot(data):
+    global Water, Sand
+    saved = SnapshotReader(data)
+    g = globals()
+    thing_classes  = subclasses(Thing)
+    school_classes = subclasses(School)
+
+    # counters, level of detail, and the surfaces
+    counters = saved.numbers()
+    for name, value in zip(snapshot_counters, counters):
+        g[name] = value
+    detail.setLevel( counters[-1] )
+    position, color = saved.numbers()
+    Water = Surface(position, saved.strings[color])
+    position, color = saved.numbers()
+    Sand = Surface(position, saved.strings[color])
+
+    # background (with the scenery baked in)
+    glyph_ids = saved.numbers()
+    strings = saved.strings
+    Aquarium.background = [ glyph_row([ glyph_code(strings[glyph_id])
+                                        for glyph_id in glyph_ids[y*WIDTH : (y+1)*WIDTH] ])
+                            for y in range(HEIGHT) ]
+    Aquarium.stage = [ row[:] for row in Aquarium.background ]
+
+    # every thing
+    things = []
+    for _ in range( saved.unpack('I')[0] ):
+        class_name, color, y, x, dy, dx, speed, facing = saved.unpack('8i')
+        thing = thing_classes[ saved_name(strings[class_name], thing_classes) ]( [y, x], strings[color] )
+        thing.direction = [dy, dx]
+        if isinstance(thing, MovingThing):
+            thing.speed = speed
+        fields = saved.numbers()
+        for i in range(0, len(fields), 3):
+            field, kind, value = fields[i:i+3]
+            field = saved_name(strings[field], thing.snapshot_fields)
+            if kind == 1:
+                value = getattr( thing, saved_name(strings[value], methods_of(thing)) )
+            elif kind == 2:
+                value = strings[value]
+            setattr(thing, field, value)
+        if facing != -1:
+            thing.sprite = get_sprite(thing, strings[facing])
+        things.append(thing)
+    for _ in snapshot_thing_lists:
+        members = saved.numbers()
+        g[ saved_name(strings[members[0]], snapshot_thing_lists) ] = [ things[i] for i in members[1:] ]
+
+    # schools (their spatial grids and swarm engines are made new)
+    all_schools = []
+    for _ in range( saved.unpack('I')[0] ):
+        class_name, lead, follow, distance, desire = saved.numbers()
+        students = [ things[i] for i in saved.numbers() ]
+        school = school_classes[ saved_name(strings[class_name], school_classes) ](
+                     students, strings[lead], strings[follow], distance )
+        school.following_order = [ '0' if i == -1 else things[i] for i in saved.numbers() ]
+        if desire != -1:
+            school.desire = things[desire]
+        all_schools.append(school)
+    for _ in snapshot_school_lists:
+        members = saved.numbers()
+        g[ saved_name(strings[members[0]], snapshot_school_lists) ] = [ all_schools[i] for i in members[1:] ]
+
+    # what the scenery covers up, and the creatures on top of the background
+    if seabed is not None:
+        seabed.show()
+    else:
+        cover_scenery()
+    track_ecosystem()
+    render()
+
+#------------------------------- HEADLESS RUNS ---------------------------------
+
+# run the simulation without displaying it, and print timings as JSON
+def run_headless(ticks):
+    # (keep the timings of every tick)
+    phases = PhaseProfiler( [name for name, phase in loop_phases], max(ticks, 1) )
+
+    dirty_cells = 0
+    # (each creature and bubble should be drawn once a loop, and each cell
+    # written at most once)
+    draws = 0
+    entities = 0
+    writes = 0
+    visible = 0
+    t_start = time()
+    for _ in range(ticks):
+        simulate(phases)
+        record_frame()
+        dirty_cells += Aquarium.dirtyCells()
+        draws += Aquarium.draws
+        entities += len(ecosystem.things)
+        writes += Aquarium.writes
+        visible += len(Aquarium.shown)
+        Aquarium.clean()
+    seconds = time() - t_start
+
+    report = {
+        'width'             : WIDTH,
+        'height'            : HEIGHT + 1,
+        'seed'              : SEED,
+        'ticks'             : ticks,
+        'seconds'           : seconds,
+        'ticks_per_second'  : ticks / max(seconds, 1e-9),
+        'phases_ms_per_tick': dict( (name, 1000 * phases.total[name] / max(ticks, 1))
+                                    for name in phases.names ),
+        'phases_ms'         : phases.report(),
+        'dirty_cells_per_tick': dirty_cells / float(max(ticks, 1)),
+        'draws_per_tick'    : draws / float(max(ticks, 1)),
+        'entities_per_tick' : entities / float(max(ticks, 1)),
+        'cell_writes_per_tick': writes / float(max(ticks, 1)),
+        'visible_cells_per_tick': visible / float(max(ticks, 1)),
+        'cells'             : WIDTH * (HEIGHT + 1),
+        'entities'          : {
+            'swimmers'      : len(Eco_Swimmers),
+            'fishies'       : len(Eco_Fishies),
+            'barracudas'    : len(Eco_Barracuda),
+            'whales'        : len(Eco_Whales) + len(Eco_BabyWhaleFollower),
+            'jellyfish'     : len(Eco_Jellyfish),
+            'bottomfeeders' : len(Eco_BottomFeeders),
+            'schools'       : len(schools),
+            'school_fish'   : sum( len(school.students) for school in schools ),
+            'bubbles'       : len(bub_list),
+            'scenery'       : len(BG_List) + len(MG_List) + len(FG_List),
+        },
+    }
+    print( json.dumps(report, indent=2, sort_keys=True) )
+
+
+#-------------------------------- EVENT LOOP -----------------------------------
+
+# Runs frames on an asyncio event loop, and reads keys without waiting for them
+#   space / p       pause and resume
+#   + / -           speed up and slow down
+#   v               toggle verbose (same as ctrl-\)
+#   q               quit
+class EventLoop(object):
+    slowest = 0.25
+    fastest = 4.0
+
+    def __init__(self, pacer, frame):
+        self.pacer = pacer
+        self.frame = frame          # function that runs one frame
+        self.loop = asyncio.new_event_loop()
+        self.next_frame = None      # timer for the next frame (None when paused)
+        self.keys = {
+            ' ' : self.togglePause,
+            'p' : self.togglePause,
+            '+' : self.faster,
+            '=' : self.faster,
+            '-' : self.slower,
+            'v' : toggle_verbose,
+            'q' : self.loop.stop,
+        }
+        # (keys that send escape sequences)
+        self.sequences = {
+            '\x1b[D' : self.scrollLeft,
+            '\x1b[C' : self.scrollRight,
+        }
+
+    # Keyboard controls only work when typing into a terminal
+    @staticmethod
+    def available():
+        return asyncio is not None and sys.stdin.isatty()
+
+    # Run until q is pressed (or ctrl-c)
+    def run(self):
+        fd = sys.stdin.fileno()
+        terminal_settings = termios.tcgetattr(fd)
+        # (get keys as soon as they're pressed, without echoing them)
+        tty.setcbreak(fd)
+        try:
+            self.loop.add_reader(fd, self.readKeys)
+            self.scheduleFrame(0)
+            self.loop.run_forever()
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, terminal_settings)
+            self.loop.close()
+
+    def scheduleFrame(self, delay):
+        self.next_frame = self.loop.call_later(delay, self.runFrame)
+
+    def runFrame(self):
+        self.frame()
+        self.scheduleFrame( self.pacer.finishFrame() )
+
+    def readKeys(self):
+        keys = os.read(sys.stdin.fileno(), 32).decode('utf-8', 'ignore')
+        i = 0
+        while i < len(keys):
+            if keys[i:i+3] in self.sequences:
+                self.sequences[ keys[i:i+3] ]()
+                i += 3
+                continue
+            if keys[i] in self.keys:
+                self.keys[ keys[i] ]()
+            i += 1
 
-            unlucky_class  = unlucky_school.students
+    # (nothing is scheduled while paused, so the loop just waits for a key)
+    def togglePause(self):
+        global paused
+        paused = not paused
+        if paused:
+            self.next_frame.cancel()
+            self.next_frame = None
+            if verbose:
+                debug_printout()
+        else:
+            self.pacer.restart()
+            self.scheduleFrame(0)
 
-        #-----------------------------------------------------------------------
-        # choose last fish in students list.  Erase it.  Remove from lists.
-        if len(unlucky_class) > min_fish_per_school:
-            unlucky_fish = unlucky_class.pop()
-            unlucky_fish.erase()
-            Eco_Swimmers.remove(unlucky_fish)
+    def setSpeed(self, new_speed):
+        global speed
+        speed = new_speed
+        self.pacer.step_time = SIM_STEP / speed
+        if paused and verbose:
+            debug_printout()
 
-            # recreate following order, after fish has been removed
-            unlucky_school.createFollowingOrder()
+    def faster(self):
+        self.setSpeed( min(speed * 2, self.fastest) )
 
-        #-----------------------------------------------------------------------
-        # (if school is empty, remove it from the list of schools)
-        if len(unlucky_class) == 0:
-            try:
-                schools.remove(unlucky_school)
-            except:
-                pass
+    def slower(self):
+        self.setSpeed( max(speed / 2, self.slowest) )
+
+    # (shown straight away when paused, otherwise with the next frame)
+    def scroll(self, dx):
+        if seabed is None:
+            return
+        scroll_seabed(dx)
+        if paused:
+            Aquarium.display()
+            if verbose:
+                debug_printout()
+
+    def scrollLeft(self):
+        self.scroll(-scroll_step)
+
+    def scrollRight(self):
+        self.scroll(scroll_step)
+
+#------------------------------ SPLIT PROCESSES --------------------------------
+
+# (the simulation process starts as a copy of this one, so it has to fork)
+try:
+    processes = multiprocessing.get_context('fork')
+except AttributeError:
+    processes = multiprocessing
+
+# Finished frames, passed from the simulation process to the drawing process
+# in shared memory, as a grid of glyph codes (double buffered: the simulation
+# fills in the back buffer, then swaps it to the front)
+class SharedFrames(object):
+    def __init__(self, stage):
+        self.height = len(stage)
+        self.width = len(stage[0])
+        cells = self.height * self.width
+        self.buffers = [ processes.RawArray(GLYPH_TYPECODE, cells) for _ in range(2) ]
+        self.front = processes.RawValue('i', 0)
+        # (held while swapping buffers, and while copying the front buffer)
+        self.lock = processes.Lock()
+        self.ready = processes.Event()
+        self.stop = processes.Event()
+        # (keyboard controls, passed from the drawing process to the simulation)
+        self.controls, self.control_sender = processes.Pipe(False)
+
+        # (both processes start with the glyph codes given out so far, and the
+        # text of new ones is sent over in the order they get their codes)
+        self.new_glyphs = processes.Queue()
+        self.sent = len(glyph_text)
+
+        # rows each buffer still needs (simulation side), and the rows of
+        # codes last drawn (drawing side)
+        self.stale = [ set(range(self.height)), set(range(self.height)) ]
+        self.shown = [ list(row) for row in stage ]
+        codes = sum(self.shown, [])
+        for buf in self.buffers:
+            buf[:] = codes
+
+    #----------------------------- simulation side -----------------------------
+    # Put the stage in the back buffer, and swap it to the front
+    def publish(self, stage, dirty):
+        while self.sent < len(glyph_text):
+            self.new_glyphs.put( glyph_text[self.sent] )
+            self.sent += 1
+        for rows in self.stale:
+            rows.update(dirty)
+        back = 1 - self.front.value
+        buf = self.buffers[back]
+        width = self.width
+        for y in self.stale[back]:
+            buf[y*width : (y+1)*width] = stage[y]
+        self.stale[back] = set()
+        with self.lock:
+            self.front.value = back
+        self.ready.set()
+
+    # Keyboard controls sent over since last time (see SplitEventLoop)
+    def received(self):
+        while self.controls.poll():
+            yield self.controls.recv()
+
+    #------------------------------ drawing side -------------------------------
+    def send(self, control, value):
+        self.control_sender.send( (control, value) )
+
+    # (wait for the text of glyph codes that's still on its way)
+    def receive(self, codes):
+        while max(codes) >= len(glyph_text):
+            glyph_code( self.new_glyphs.get() )
+
+    # Copy the latest frame onto a window's stage (marking the rows that changed)
+    def show(self, window):
+        with self.lock:
+            frame = self.buffers[self.front.value][:]
+        width = self.width
+        for y in range(self.height):
+            row = frame[y*width : (y+1)*width]
+            if row != self.shown[y]:
+                self.receive(row)
+                self.shown[y] = row
+                window.stage[y] = glyph_row(row)
+                window.touch(y, 0, width)
+
+# Runs the simulation (in its own process), publishing a frame each loop
+def simulate_frames(frames, random_states):
+    global pacer
+    # (python reseeds random in a new process, so carry on where this one was,
+    #  with randint's blocks and the swarm engine's numbers too)
+    state, blocks, swarm_state = random_states
+    random_setstate(state)
+    random_blocks.setstate(blocks)
+    if swarm_random is not None:
+        swarm_random.set_state(swarm_state)
+    # (ctrl-c and ctrl-\ are for the drawing process)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGQUIT, signal.SIG_IGN)
+    pacer = FramePacer(DELAY, SIM_STEP / speed, overrun_policy, max_catch_up)
+    try:
+        while not frames.stop.is_set():
+            for control, value in frames.received():
+                obey(control, value)
+            # (nothing moves while paused, but scrolling still shows)
+            if paused:
+                if Aquarium.dirty:
+                    frames.publish(Aquarium.stage, Aquarium.dirty)
+                    Aquarium.clean()
+                frames.controls.poll(DELAY)
+                continue
+            for _ in range( pacer.beginFrame() ):
+                simulate(profiler)
+                record_frame()
+            frames.publish(Aquarium.stage, Aquarium.dirty)
+            Aquarium.clean()
+            detail.update( pacer.workTime() )
+            pacer.endFrame()
+    finally:
+        # (exit handlers don't run in this process)
+        if args.record:
+            save_recording(args.record)
+        save_snapshot()
+
+# Carry out a keyboard control from the drawing process
+def obey(control, value):
+    global paused, speed
+    if control == 'pause':
+        paused = value
+        if not paused:
+            pacer.restart()
+    elif control == 'speed':
+        speed = value
+        pacer.step_time = SIM_STEP / speed
+    elif control == 'scroll':
+        if seabed is not None:
+            scroll_seabed(value)
+
+# Keyboard controls for the drawing process:  the same keys as EventLoop, but
+# pausing, speed and scrolling are passed on to the simulation process
+class SplitEventLoop(EventLoop):
+    def __init__(self, pacer, frame, frames):
+        EventLoop.__init__(self, pacer, frame)
+        self.frames = frames
+
+    # (frames keep being drawn while paused, to show scrolling)
+    def togglePause(self):
+        global paused
+        paused = not paused
+        self.frames.send('pause', paused)
+
+    def setSpeed(self, new_speed):
+        global speed
+        speed = new_speed
+        self.frames.send('speed', speed)
+
+    def scroll(self, dx):
+        self.frames.send('scroll', dx)
+
+# Draw the frames from a simulation process, until it stops
+def run_split():
+    global simulation_process, recording, snapshot_path
+    frames = SharedFrames(Aquarium.stage)
+    swarm_state = swarm_random.get_state() if swarm_random is not None else None
+    simulation_process = processes.Process(target=simulate_frames,
+                                           args=(frames, (random_getstate(),
+                                                         random_blocks.getstate(),
+                                                         swarm_state)))
+    simulation_process.frames = frames
+    simulation_process.daemon = True
+    simulation_process.start()
+    # (the simulation process saves the recording and the aquarium)
+    recording = None
+    snapshot_path = None
+
+    if EventLoop.available():
+        run_split_frames(frames)
+        # (q was pressed:  clean up the same way as ctrl-c)
+        if simulation_process.is_alive():
+            signal_SIGINT_handler(signal.SIGINT, None)
+        return
+
+    while simulation_process.is_alive():
+        if frames.ready.wait(DELAY):
+            frames.ready.clear()
+            show_frame(frames)
+
+# Draw the latest frame from the simulation process
+def show_frame(frames):
+    frames.show(Aquarium)
+    if profiler is None:
+        Aquarium.display()
+    else:
+        profiler.measure('display', Aquarium.display)
+
+# Draw frames with keyboard controls (see SplitEventLoop), until q is pressed
+# or the simulation process stops
+def run_split_frames(frames):
+    global pacer
+    # (timings in the debug printout are for drawing)
+    pacer = FramePacer(DELAY, SIM_STEP, overrun_policy, max_catch_up)
+
+    def draw_frame():
+        pacer.beginFrame()
+        if not simulation_process.is_alive():
+            events.loop.stop()
+            return
+        if frames.ready.is_set():
+            frames.ready.clear()
+            show_frame(frames)
+        # (repaint after the debug printout is turned off, even while paused)
+        elif Aquarium.last_frame is None:
+            Aquarium.display()
+        if verbose:
+            debug_printout()
+
+    events = SplitEventLoop(pacer, draw_frame, frames)
+    events.run()
+
+# Ask the simulation process to stop, and wait for it
+def stop_simulation():
+    frames = simulation_process.frames
+    frames.stop.set()
+    simulation_process.join(1)
+    if simulation_process.is_alive():
+        simulation_process.terminate()
 
 
 ################################################################################
@@ -2258,130 +5729,179 @@ if word_bubbles == True:
         word_bubbles = False
 
 # Look for argument for verbosity
-if len(sys.argv) > 1 and  sys.argv[1] in ['-v', '--verbose']:
+if args.verbose:
     verbose = True
 
+# Simulate and draw in separate processes
+if args.split:
+    split_processes = True
 
-#------------------------------ CREATE AQUARIUM --------------------------------
-# instantiate Aquarium Window
-Aquarium = Window(choice(window_colors))
+# Endless seabed (also under a world wider than the window)
+if args.scroll or WORLD_WIDTH > WIDTH:
+    scrolling_seabed = True
 
+# The swarm engine needs numpy
+if args.swarm:
+    swarm_engine = True
+if np is None:
+    swarm_engine = False
 
-#----------------------------- CREATE BACKGROUND -------------------------------
-# define water
-water_color = choice(water_colors)
-if draw_water == True:
-    water_surface = water_position
-else:
-    water_surface = 0
-Water = Surface(water_surface, water_color)
-if draw_water == True:
-    Water.draw()
-    Water.drawAbove()
+# number of loops so far
+tick = 0
 
-# define sand
-sand_color = choice(sand_colors)
-Sand = Surface(sand_position, sand_color)
-if draw_sand == True:
-    Sand.drawUnder()
+# Record frame hashes (for replaying the session later)
+recording = None
+if args.record:
+    start_recording(args.record)
 
-# define kelp color as different from sand color
-kelp_color = sand_color
-while kelp_color == sand_color:
-    kelp_color = choice(kelp_colors)
+# Level of detail (goes down when frames take too long, and back up again)
+detail = DetailController(frame_budget)
 
-# The order in which things are drawn goes from background -> midground -> foreground
-SF = SeafloorGenerator()
-Eco = EcosystemGenerator()
+# Every creature and bubble (see EntityStore)
+ecosystem = EntityStore()
 
-# generate layers
-generate_background()
-generate_midground()
-generate_foreground()
+# Endless seabed to scroll along (see Seabed), and the world column just left
+# of the window (on the seabed, and in the world the creatures swim in, which
+# starts with the window in the middle of it)
+seabed = Seabed(seabed_cache_kb) if scrolling_seabed else None
+camera_x = (WORLD_WIDTH - WIDTH) // 2
+view_x = camera_x
 
-# Remove all coral that are off-screen (so fish don't try to follow an invisible coral)
-remove_peripherals(BG_List, MG_List, FG_List)
+# Time each part of the loop
+if args.profile:
+    profiler = PhaseProfiler( [name for name, phase in loop_phases] + ['display', 'frame'] )
 
-#set eveything so far as the background environment
-Aquarium.background = deepcopy(Aquarium.stage)
+# Save the whole aquarium on exit
+snapshot_path = args.save
+if snapshot_path:
+    atexit.register(save_snapshot)
 
 
-#------------------------------ CREATE ECOSYSTEM -------------------------------
-generate_ecosystem()
-generate_all_schools()
-
-# initial bubble list
-bub = 1
-bub_list = []
-# variable for changing which coral the school is going around
-cor = 0
-# variable for making sure fish reduction doesn't happen forever
-reduce_clock = 0
-# variables for modulating ocean current
-ocean_current_value = 0
-ocean_current_count = 0
-# list of corals to choose from (when following)
-coral_list = BG_Kelp + MG_Kelp + FG_Kelp + MG_BrainCoral + MG_TreeCoral
+#------------------------------ CREATE AQUARIUM --------------------------------
+# instantiate Aquarium Window
+Aquarium = Window(choice(window_colors))
 
-# Hide the cursor
-os.system('echo -ne "\x1b[?25l"')
+# Bring back a saved aquarium (instead of creating the background and ecosystem)
+if restoring is not None:
+    try:
+        restore_snapshot(restoring)
+    except ValueError as error:
+        parser.error("{} can't be restored: {}".format(saved_from, error))
 
 
-################################################################################
-##################################### LOOP #####################################
-while True:
-    # ocean currents move all the swimmers
-    if periodic_ocean_current_drift == True:
-        ocean_drift()
+#----------------------------- CREATE BACKGROUND -------------------------------
+if restoring is None:
+    # define water
+    water_color = choice(water_colors)
+    if draw_water == True:
+        water_surface = water_position
+    else:
+        water_surface = 0
+    Water = Surface(water_surface, water_color)
+    if draw_water == True:
+        Water.draw()
+        Water.drawAbove()
+
+    # define sand
+    sand_color = choice(sand_colors)
+    Sand = Surface(sand_position, sand_color)
+    if draw_sand == True:
+        Sand.drawUnder()
+
+    # define kelp color as different from sand color
+    kelp_color = sand_color
+    while kelp_color == sand_color:
+        kelp_color = choice(kelp_colors)
+
+    # The order in which things are drawn goes from background -> midground -> foreground
+    SF = SeafloorGenerator()
+    Eco = EcosystemGenerator()
+
+    if seabed is not None:
+        # the scenery comes from the seabed's chunks instead (already baked)
+        BG_Dunes, BG_Kelp, BG_List = [], [], []
+        MG_Dunes, MG_TreeCoral, MG_BrainCoral, MG_Kelp, MG_List = [], [], [], [], []
+        FG_Kelp, FG_Dunes, FG_List = [], [], []
+        seabed.show()
+    else:
+        # generate layers
+        generate_background()
+        generate_midground()
+        generate_foreground()
 
-    # Get times for waiting between frames
-    t_a = time()
-    t_b = time()
+        # Remove all coral that are off-screen (so fish don't try to follow an invisible coral)
+        remove_peripherals(BG_List, MG_List, FG_List)
 
+        # bake the scenery into the background (it never moves)
+        bake_scenery()
 
-    #============================= MIDGROUND ===================================
-    # draw midground layer
-    SF.DrawList(MG_List)
 
-    #------------------ ocean floor ------------------------
-    # Move all (independent) creatures
-    automate_bottomfeeders()
+#------------------------------ CREATE ECOSYSTEM -------------------------------
+if restoring is None:
+    generate_ecosystem()
+    generate_all_schools()
+
+    # initial bubble list
+    bub = 1
+    bub_list = []
+    # variable for changing which coral the school is going around
+    cor = 0
+    # variables for modulating ocean current
+    ocean_current_value = 0
+    ocean_current_count = 0
+    # list of corals to choose from (when following)
+    if seabed is not None:
+        coral_list = seabed.corals()
+    else:
+        coral_list = BG_Kelp + MG_Kelp + FG_Kelp + MG_BrainCoral + MG_TreeCoral
+
+    # keep track of all the creatures (and bubbles)
+    track_ecosystem()
 
-    # Draw coral and kelp in midground (to cover up BottomFeeders)
-    SF.DrawList(MG_TreeCoral)
-    SF.DrawList(MG_Kelp)
+# Replay a recorded session
+if replaying is not None:
+    sys.exit( 0 if run_replay(replaying) else 1 )
 
-    #-------------------- swimmers -------------------------
-    # automate moving of fish and whales, etc.
-    automate_swimmers()
+# Run a benchmark instead of the aquarium
+if args.benchmark:
+    benchmarks[args.benchmark]()
+    sys.exit()
 
-    # fish sometimes group around coral
-    # barracuda sometimes hunts fish
-    periodic_grouping()
+# Run without displaying anything
+if args.headless:
+    run_headless(args.ticks)
+    sys.exit()
 
-    # schools follow and flee other things
-    school_special_behaviors()
+# Hide the cursor
+os.system('echo -ne "\x1b[?25l"')
 
-    # ----------- RE-DRAW ALL SWIMMERS -----------#
-    # (some images may have been erased in "move()")
-    for creature in Eco_Swimmers:
-        creature.draw()
+# Simulate in another process, and draw its frames here
+if split_processes:
+    run_split()
+    os.system('echo "\x1b[?25h"')
+    os.system('tput sgr0')
+    sys.exit(1)
 
 
-    #========================= ACTIVE FOREGROUND ===============================
-    automate_bubbles()
+################################################################################
+##################################### LOOP #####################################
+# Sleeps between frames, and keeps the simulation moving at a steady rate
+pacer = FramePacer(DELAY, SIM_STEP / speed, overrun_policy, max_catch_up)
 
-    # Draw long kelp in the front
-    SF.DrawList(FG_Kelp[:scale])
-    SF.DrawList(FG_Dunes)
-    SF.DrawList(FG_Kelp[scale:])
+def run_frame():
+    #============================= SIMULATE ====================================
+    # midground, bottomfeeders, swimmers, bubbles, foreground (see loop_phases)
+    # (usually one step per frame, more if the simulation is catching up)
+    for _ in range( pacer.beginFrame() ):
+        simulate(profiler)
+        record_frame()
 
 
     #========================== DISPLAY AQUARIUM ===============================
-    # Wait to display aquarium
-    while (t_b - t_a) < DELAY:
-        t_b = time()
-    Aquarium.display()
+    if profiler is None:
+        Aquarium.display()
+    else:
+        profiler.measure('display', Aquarium.display)
 
 
     #---------------------- debug printout -------------------------
@@ -2389,23 +5909,22 @@ while True:
         debug_printout()
 
 
-    #========================== REDUCE ECOSYSTEM ===============================
-    if reduce_clock < 20:
-        #-----------------------------------------------------------------------
-        # if it's taking too much time before each refesh, remove some of the fish
-        if (t_b - t_a) > DELAY*1.25:
-            reduce_ecosystem(max_fish//10)
-            reduce_clock -= 1
-        elif (t_b - t_a) > DELAY*1.125:
-            reduce_ecosystem(max_fish//20)
-            reduce_clock -= 1
-        elif (t_b - t_a) > DELAY*1.1:
-            reduce_ecosystem(1)
-            reduce_clock -= 1
-        #-----------------------------------------------------------------------
-        else:
-            reduce_clock += 1
+    #========================= ADJUST LEVEL OF DETAIL ==========================
+    # if it's taking too much time before each refresh, shed some work (and
+    # put it back when there's time again), using the time this frame
+    # actually took to work out and display
+    detail.update( pacer.workTime() )
+    if profiler is not None:
+        profiler.add( 'frame', pacer.workTime() )
 
-    #---------------------------------------------------------------------------
-    #elif (t_b - t_a) > DELAY*1.4:
-    #    reduce_clock = 0
+# Run frames with keyboard controls (see EventLoop) if possible, otherwise
+# just run them one after another
+if EventLoop.available():
+    EventLoop(pacer, run_frame).run()
+    # (q was pressed:  clean up the same way as ctrl-c)
+    signal_SIGINT_handler(signal.SIGINT, None)
+
+while True:
+    run_frame()
+    # Sleep until the next frame
+    pacer.endFrame()
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'aquarium.py')
+
+# (everything in aquarium.py up to here sets the aquarium up, and the rest
+#  runs it:  a replay, a benchmark, a headless run or the loop)
+RUN_MARKER = "# Replay a recorded session\n"
+
+
+# Set up an aquarium with command line arguments, without running it, and
+# return its globals
+def load_aquarium(*argv):
+    with open(SCRIPT) as f:
+        source = f.read()
+    source = source[:source.index(RUN_MARKER)]
+    saved_argv = sys.argv
+    sys.argv = [SCRIPT] + list(argv)
+    try:
+        namespace = {'__name__': 'aquarium', '__file__': SCRIPT}
+        exec(compile(source, SCRIPT, 'exec'), namespace)
+    finally:
+        sys.argv = saved_argv
+    return namespace
+
+
+@pytest.fixture
+def aquarium():
+    return load_aquarium
@@ -0,0 +1,35 @@
+# Shedding detail (see DetailController)
+
+
+def test_frozen_jellyfish_keep_their_resting_picture(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '1')
+    detail = aq['detail']
+    jellyfish = aq['Jellyfish']([10, 10], 'white')
+    jellyfish.direction = [0, -1]
+    rest = jellyfish.left_0()
+
+    # frozen in the middle of a stroke:  drawn resting
+    frozen = next( level for level, shed in enumerate(detail.levels) if shed[1] )
+    detail.setLevel(frozen)
+    jellyfish.bell = jellyfish.bell_1
+    jellyfish.getPicture()
+    assert jellyfish.sprite.picture == rest
+
+    # and after unfreezing, resting still looks like resting
+    detail.setLevel(0)
+    jellyfish.bell = jellyfish.bell_1
+    jellyfish.getPicture()
+    assert jellyfish.sprite.picture == jellyfish.left_2()
+    jellyfish.bell = 0
+    jellyfish.getPicture()
+    assert jellyfish.sprite.picture == rest
+    assert aq['sprites'][(aq['Jellyfish'], 'left', 0)].picture == rest
+
+
+def test_jellyfish_at_the_end_of_a_stroke_have_no_picture(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '1')
+    jellyfish = aq['Jellyfish']([10, 10], 'white')
+    jellyfish.direction = [0, 1]
+    jellyfish.bell = jellyfish.bell_3
+    jellyfish.getPicture()
+    assert jellyfish.size[1] == 0
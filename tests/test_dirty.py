@@ -0,0 +1,52 @@
+# Dirty spans of the stage (see Window.touch)
+
+
+# a tank with nothing in it but bubbles
+def bubbles_only(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '1')
+    ecosystem = aq['ecosystem']
+    for thing in list(ecosystem.things):
+        if not isinstance(thing, aq['Bubble']):
+            ecosystem.remove(thing)
+    for name in aq['snapshot_school_lists']:
+        aq[name][:] = []
+    # (take the creatures off the stage)
+    aq['simulate']()
+    aq['Aquarium'].clean()
+    return aq
+
+
+# rows the bubbles are on
+def bubble_rows(aq):
+    return set( bubble.position[0] + y for bubble in aq['bub_list'] for y in range(bubble.size[0]) )
+
+
+def test_idle_tank_only_dirties_where_bubbles_are(aquarium):
+    aq = bubbles_only(aquarium)
+    window = aq['Aquarium']
+    cells = window.width * window.height
+    bubbly = 0
+    for _ in range(200):
+        rows = bubble_rows(aq)
+        aq['simulate']()
+        rows |= bubble_rows(aq)
+        assert set(window.dirty) <= rows
+        assert window.dirtyCells() < cells // 10
+        if not aq['bub_list'] and not rows:
+            assert window.dirty == {}
+        bubbly += bool(window.dirty)
+        window.clean()
+    # (there were bubbles to look at)
+    assert bubbly > 0
+
+
+def test_nothing_moving_dirties_nothing(aquarium):
+    aq = bubbles_only(aquarium)
+    aq['bubbles'] = False
+    for bubble in list(aq['bub_list']):
+        aq['ecosystem'].remove(bubble)
+    aq['simulate']()
+    aq['Aquarium'].clean()
+    for _ in range(20):
+        aq['simulate']()
+        assert aq['Aquarium'].dirty == {}
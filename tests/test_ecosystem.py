@@ -0,0 +1,50 @@
+# The entity store (see EntityStore)
+
+
+def test_prey_view_is_the_sea_monkeys(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2')
+    sea_monkeys = [ student for school in aq['sea_monkey_schools'] for student in school.students ]
+    prey = aq['ecosystem'].view('prey')
+    assert sorted(fish.entity for fish in prey) == sorted(fish.entity for fish in sea_monkeys)
+    assert aq['ecosystem'].view('prey') is prey
+
+
+def test_remove_keeps_ids_and_groups(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2')
+    ecosystem = aq['ecosystem']
+    swimmers = ecosystem.view('swimmers')
+    unlucky = swimmers[0]
+    others = dict( (fish, fish.entity) for fish in ecosystem.things if fish is not unlucky )
+
+    ecosystem.remove(unlucky)
+    assert unlucky.entity is None
+    assert unlucky not in ecosystem.view('swimmers')
+    assert unlucky not in ecosystem.things
+    assert all( fish.entity == entity for fish, entity in others.items() )
+    assert all( ecosystem.things[ecosystem.rows[fish.entity]] is fish for fish in others )
+
+
+def columns_match_things(ecosystem):
+    ecosystem.refresh()
+    for row, thing in enumerate(ecosystem.things):
+        assert ecosystem.name(ecosystem.column['species'][row]) == thing.__class__.__name__
+        assert ecosystem.name(ecosystem.column['color'][row]) == thing.color
+        assert ecosystem.column['sprite'][row] == thing.sprite.code
+        assert ecosystem.column['y'][row] == int(thing.position[0])
+        assert ecosystem.column['x'][row] == int(thing.position[1])
+        assert ecosystem.column['dx'][row] == thing.direction[1]
+        assert ecosystem.column['speed'][row] == thing.speed
+
+
+def test_columns_follow_the_things(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2')
+    ecosystem = aq['ecosystem']
+    for _ in range(5):
+        aq['simulate']()
+    columns_match_things(ecosystem)
+
+    ecosystem.remove( ecosystem.view('swimmers')[3] )
+    columns_match_things(ecosystem)
+    schools = aq['schools']
+    for thing, number in zip(ecosystem.things, ecosystem.column['school']):
+        assert number == -1 or thing in schools[number].students
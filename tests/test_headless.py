@@ -0,0 +1,16 @@
+# Headless runs (see run_headless)
+import pytest
+
+
+def test_headless_size_doesnt_need_a_terminal(aquarium, monkeypatch):
+    monkeypatch.delenv('TERM', raising=False)
+    aq = aquarium('--headless', '--seed', '1')
+    assert (aq['WIDTH'], aq['HEIGHT'] + 1) == (80, 24)
+
+
+@pytest.mark.parametrize('seed', ['-5', '99999999999'])
+def test_any_seed_works(aquarium, seed):
+    aq = aquarium('--headless', '--swarm', '--seed', seed)
+    assert aq['SEED'] == int(seed)
+    for _ in range(5):
+        aq['simulate']()
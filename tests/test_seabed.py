@@ -0,0 +1,29 @@
+# The endless seabed (see Seabed)
+
+
+def window(aq):
+    Aquarium = aq['Aquarium']
+    return ( [ list(row) for row in Aquarium.background ],
+             [ list(row) for row in Aquarium.cover['midground'] ],
+             [ list(row) for row in Aquarium.cover['foreground'] ],
+             [ list(row) for row in Aquarium.depth ] )
+
+
+def test_scrolling_matches_showing_from_scratch(aquarium):
+    aq = aquarium('--headless', '--width', '120', '--height', '30', '--seed', '5', '--scroll')
+    seabed = aq['seabed']
+    for dx in [8, 8, 30, -5, 50, -17, 3]:
+        seabed.scroll(dx)
+        scrolled = window(aq)
+        seabed.show()
+        assert window(aq) == scrolled
+
+
+def test_chunks_get_their_share_of_the_window(aquarium):
+    aq = aquarium('--headless', '--width', '120', '--height', '30', '--seed', '5', '--scroll')
+    ChunkGenerator = aq['ChunkGenerator']
+    width = aq['Seabed'].width
+    # (three windows' worth of chunks, starting left of the world)
+    chunks = [ ChunkGenerator(index * width, width) for index in range(-3, 6) ]
+    for n in [0, 1, 5, 24]:
+        assert sum( chunk.share(n) for chunk in chunks ) == 3 * n
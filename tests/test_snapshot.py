@@ -0,0 +1,53 @@
+# Saving and restoring the aquarium (see SNAPSHOTS)
+import json
+import subprocess
+import sys
+import zlib
+
+import pytest
+
+from conftest import SCRIPT
+
+
+# a snapshot with one of the names in its string table swapped for another
+# (of the same length)
+def tampered(aq, data, old, new):
+    header = aq['SNAPSHOT_HEADER'].size
+    body = zlib.decompress(data[header:])
+    assert old.encode() in body
+    return data[:header] + zlib.compress( body.replace(old.encode(), new.encode()) )
+
+
+def test_restore_brings_back_the_same_aquarium(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '-5')
+    for _ in range(10):
+        aq['simulate']()
+    data = aq['snapshot']()
+    aq['restore_snapshot'](data)
+    assert aq['snapshot']() == data
+
+
+@pytest.mark.parametrize('old, new', [ ('Eco_Fishies', 'random_seed'),    # a list
+                                       ('SeaMonkey', 'Generator'),        # a class
+                                       ('Monarch', 'Surface') ])          # a school
+def test_restore_only_makes_what_the_aquarium_has(aquarium, old, new):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '3')
+    data = aq['snapshot']()
+    if old.encode() not in zlib.decompress(data[aq['SNAPSHOT_HEADER'].size:]):
+        pytest.skip("no {} in this aquarium".format(old))
+    with pytest.raises(ValueError):
+        aq['restore_snapshot']( tampered(aq, data, old, new) )
+
+
+def test_recording_a_restored_aquarium_replays(tmp_path):
+    saved = str(tmp_path / 'saved.aq')
+    recorded = str(tmp_path / 'recorded.json')
+    subprocess.check_call([sys.executable, SCRIPT, '--headless', '--ticks', '20',
+                           '--seed', '99999999999', '--save', saved], stdout=subprocess.DEVNULL)
+    subprocess.check_call([sys.executable, SCRIPT, '--headless', '--ticks', '30',
+                           '--restore', saved, '--record', recorded], stdout=subprocess.DEVNULL)
+    replay = subprocess.run([sys.executable, SCRIPT, '--replay', recorded],
+                            stdout=subprocess.PIPE, check=True)
+    report = json.loads(replay.stdout.decode())
+    assert report['ticks'] == 30
+    assert report['mismatches'] == 0
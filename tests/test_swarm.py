@@ -0,0 +1,103 @@
+# The swarm engine (see SwarmEngine)
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+
+# The nearest target for each student, by checking every one of them
+def nearest_by_brute_force(engine, ty, tedge, same_group):
+    dy = ty[None,:] - engine.y[:,None]
+    dx = tedge[None,:] - engine.x[:,None]
+    dr = dx**2 + (dy//2)**2
+    if same_group:
+        np.fill_diagonal(dr, engine.radius_sq)
+    dr[dr == 0] = engine.radius_sq
+    best = dr.argmin(axis=1)
+    return np.where(dr[np.arange(len(best)), best] < engine.radius_sq, best, -1)
+
+
+@pytest.mark.parametrize('spread', [3, 20, 200])
+def test_nearest_matches_brute_force(aquarium, spread):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2', '--swarm')
+    engine = aq['SwarmEngine'](aq['schools'][0])
+    rng = np.random.RandomState(spread)
+    engine.y = rng.randint(-spread, spread, 500)
+    engine.x = rng.randint(-spread, 2*spread, 500)
+    for same_group in [True, False]:
+        if same_group:
+            ty, tedge = engine.y, engine.x
+        else:
+            ty = rng.randint(-spread, spread, 50)
+            tedge = rng.randint(-spread, 2*spread, 50)
+        expected = nearest_by_brute_force(engine, ty, tedge, same_group)
+        assert (engine.nearest(ty, tedge, same_group) == expected).all()
+
+
+def test_store_writes_back_only_changes(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2', '--swarm')
+    school = max(aq['schools'], key=lambda school: len(school.students))
+    engine = aq['SwarmEngine'](school)
+    engine.load()
+    engine.y[0] += 1
+    engine.speed[1] += 1
+    engine.store()
+    assert school.students[0].position[0] == engine.y[0]
+    assert school.students[1].speed == engine.speed[1]
+    assert [ student.position for student in school.students ] == \
+           [ [y, x] for y, x in zip(engine.y.tolist(), engine.x.tolist()) ]
+
+
+def test_random_moves_draw_from_the_engines_own_numbers(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2', '--swarm')
+    swarm_state = aq['swarm_random'].get_state()[1].copy()
+    global_state = np.random.get_state()[1].copy()
+    for _ in range(5):
+        aq['simulate']()
+    assert (np.random.get_state()[1] == global_state).all()
+    assert not (aq['swarm_random'].get_state()[1] == swarm_state).all()
+
+
+def test_load_sees_students_moved_one_by_one(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2', '--swarm')
+    school = max(aq['schools'], key=lambda school: len(school.students))
+    engine = school.engine
+    engine.load()
+    student = school.students[-1]
+    student.direction = [1, 1]
+    student.speed = 1
+    student.move()
+    engine.load()
+    assert [engine.y[-1], engine.x[-1]] == student.position
+    assert [engine.dy[-1], engine.dx[-1]] == student.direction
+
+
+def test_grids_follow_students_across_cells(aquarium):
+    aq = aquarium('--headless', '--width', '80', '--height', '24', '--seed', '2', '--swarm')
+    for _ in range(20):
+        aq['simulate']()
+    for school in aq['schools']:
+        for grid in [school.grid, aq['sea_monkey_grid']]:
+            for student in school.students:
+                if grid in student.grids:
+                    assert grid.cell[student] == grid.cellOf(student)
+                    assert student in grid.buckets[grid.cell[student]]
+
+
+def test_batched_composite_draws_the_same(aquarium):
+    # (one after the other, since they share the random module)
+    def frames(batch):
+        aq = aquarium('--headless', '--width', '100', '--height', '30', '--seed', '3',
+                      '--swarm', '--world', '300')
+        if not batch:
+            aq['schooled'] = lambda things: None
+        glyph_text = aq['glyph_text']
+        frames = []
+        for _ in range(40):
+            aq['simulate']()
+            # (glyph codes are handed out as they're needed, so compare what they are)
+            frames.append( ( [ [ glyph_text[code] for code in row ] for row in aq['Aquarium'].stage ],
+                             aq['Aquarium'].dirty ) )
+            aq['Aquarium'].clean()
+        return frames
+    assert frames(batch=True) == frames(batch=False)